@@ -0,0 +1,323 @@
+"""Module for compiled (binary) caches of externally sourced data.
+
+Parsing CSV records into CarData/FerryData is slow for large
+timetables. A compiled cache holds the parsed records column-wise,
+one NumPy .npy file per field, which are memory-mapped on reload:
+
+	location fields : integer IDs into a table of town names
+	string fields : integer IDs into a table of strings
+	datetime fields : seconds since the epoch
+	duration fields : seconds
+	other fields : floats
+
+The tables are held in a JSON manifest along with the size and
+modification time of the source file; a cache whose source has
+changed is recompiled automatically. Towns are cached as named in the
+source and resolved to Locations on loading (by the parser's location
+table), so one cache serves parsers with any LocationMap:
+
+	>>> for record in load_ferrydata(parser, 'ferry.csv'):
+	...		pass
+
+Decoding records a row at a time is slow for large timetables, so a
+SegmentMap can also be built straight from the cached columns, viewed
+as arrays of the types bulk parsing gives (see CompiledData.arrays
+and SegmentMap.from_columns):
+
+	>>> segmap = load_segmap(parser, 'car.csv', 'ferry.csv')
+
+NumPy is optional; without it the source files are read directly.
+
+"""
+import copy
+import json
+import os
+from datetime import timedelta
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+from exdata import Parser, CarData, FerryData
+from travel import EPOCH, SegmentMap
+
+# Incremented when the compiled format changes.
+VERSION = 2
+
+# Kinds of non-float fields, by name.
+KINDS = {
+		'source' : 'location',
+		'destination' : 'location',
+		'operator' : 'string',
+		'note' : 'string',
+		'dep' : 'datetime',
+		'arr' : 'datetime',
+		'duration' : 'duration'
+		}
+
+DTYPES = {
+		'location' : 'int32',
+		'string' : 'int32',
+		'datetime' : 'int64',
+		'duration' : 'int64',
+		'float' : 'float64'
+		}
+
+RECORD_TYPES = {'CarData' : CarData, 'FerryData' : FerryData}
+
+
+class CompiledData(object):
+	"""Records of one type held column-wise in NumPy arrays.
+
+		record_type : CarData or FerryData
+		columns : dict of field name -> array
+		towns : list of town names, indexed by location ID (-1 is
+				used for unrecognised locations, i.e. None)
+		strings : list of strings, indexed by string ID
+		location : dict of town name -> Location (e.g. a Parser's
+				   location table), or None
+
+	Iterating yields the records, with towns resolved by location
+	(None where a town isn't in it). Without a location table, towns
+	are yielded by name. For the columns as arrays, see arrays.
+
+	"""
+	def __init__(self, record_type, columns, towns, strings,
+				 location=None):
+		self.record_type = record_type
+		self.columns = columns
+		self.towns = towns
+		self.strings = strings
+		self.location = location
+
+	@classmethod
+	def from_records(cls, record_type, records):
+		"""Compile an iterable of records.
+
+		Location fields may be Locations, which are also used as the
+		location table, or town names.
+
+		"""
+		ids = {'location' : {}, 'string' : {}}
+		location = {}
+		values = dict((field, []) for field in record_type._fields)
+		for record in records:
+			for field, value in zip(record_type._fields, record):
+				kind = KINDS.get(field, 'float')
+				if kind == 'location' and value is None:
+					value = -1
+				elif kind == 'location':
+					town = getattr(value, 'town', value)
+					if town is not value:
+						location[town] = value
+					value = ids[kind].setdefault(town, len(ids[kind]))
+				elif kind in ids:
+					value = ids[kind].setdefault(value, len(ids[kind]))
+				elif kind == 'datetime':
+					value = int((value - EPOCH).total_seconds())
+				elif kind == 'duration':
+					value = int(value.total_seconds())
+				values[field].append(value)
+		columns = {}
+		for field in record_type._fields:
+			dtype = DTYPES[KINDS.get(field, 'float')]
+			columns[field] = np.array(values[field], dtype=dtype)
+		return cls(record_type, columns, _table(ids['location']),
+				   _table(ids['string']), location or None)
+
+	def __len__(self):
+		return len(self.columns[self.record_type._fields[0]])
+
+	def __iter__(self):
+		fields = []
+		for field in self.record_type._fields:
+			kind = KINDS.get(field, 'float')
+			column = self.columns[field].tolist()
+			if kind == 'location':
+				table = self._locations()
+				column = [table[i] for i in column]
+			elif kind == 'string':
+				column = [self.strings[i] for i in column]
+			elif kind == 'datetime':
+				column = [EPOCH + timedelta(seconds=s) for s in column]
+			elif kind == 'duration':
+				column = [timedelta(seconds=s) for s in column]
+			fields.append(column)
+		for values in zip(*fields):
+			yield self.record_type(*values)
+
+	def arrays(self):
+		"""Columns as arrays, as parsed in bulk (see exdata.Parser).
+
+		Returns a dictionary of arrays keyed by field: object arrays
+		of (resolved) locations, string arrays, and datetime64 and
+		timedelta64 views of the cached times, which aren't copied.
+
+		"""
+		result = {}
+		for field in self.record_type._fields:
+			kind = KINDS.get(field, 'float')
+			column = self.columns[field]
+			if kind == 'location':
+				table = np.empty(len(self.towns) + 1, dtype=object)
+				for i, location in enumerate(self._locations()):
+					table[i] = location # a slice would unpack tuples
+				column = table[column]
+			elif kind == 'string':
+				table = np.array(self.strings, dtype=str)
+				column = table[column]
+			elif kind == 'datetime':
+				column = column.view('datetime64[s]')
+			elif kind == 'duration':
+				column = column.view('timedelta64[s]')
+			result[field] = column
+		return result
+
+	def _locations(self):
+		# Location (or town) of each location ID, ending with None for
+		# ID -1.
+		table = self.towns
+		if self.location is not None:
+			table = map(self.location.get, table)
+		return table + [None]
+
+	def save(self, directory, source=None):
+		"""Write the arrays and manifest to a directory.
+
+		The size and modification time of the source file, if given,
+		are recorded for invalidation (see load).
+
+		"""
+		manifest_path = os.path.join(directory, 'manifest.json')
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		elif os.path.exists(manifest_path):
+			os.remove(manifest_path) # invalid until rewritten
+		for field, column in self.columns.items():
+			np.save(os.path.join(directory, field + '.npy'), column)
+		manifest = {
+				'version' : VERSION,
+				'record_type' : self.record_type.__name__,
+				'rows' : len(self),
+				'source' : _stat(source) if source else None,
+				'towns' : self.towns,
+				'strings' : self.strings
+				}
+		# written last, so an interrupted save is never loaded
+		with open(manifest_path, 'w') as f:
+			json.dump(manifest, f)
+
+	@classmethod
+	def load(cls, directory, source=None, location=None):
+		"""Load compiled data with memory-mapped arrays.
+
+		Towns are resolved with the location table, if given (see
+		CompiledData). Returns None if there's no valid cache in the
+		directory, or if it was compiled from a different version of
+		the source file.
+
+		"""
+		try:
+			with open(os.path.join(directory, 'manifest.json')) as f:
+				manifest = json.load(f)
+		except (IOError, ValueError):
+			return None
+		if (manifest.get('version') != VERSION or
+				(source and manifest['source'] != _stat(source))):
+			return None
+		record_type = RECORD_TYPES[manifest['record_type']]
+		columns = {}
+		for field in record_type._fields:
+			path = os.path.join(directory, field + '.npy')
+			try:
+				columns[field] = np.load(path, mmap_mode='r')
+			except IOError:
+				return None
+			if len(columns[field]) != manifest['rows']:
+				return None
+		towns = map(_native, manifest['towns'])
+		strings = map(_native, manifest['strings'])
+		return cls(record_type, columns, towns, strings, location)
+
+
+def load_cardata(parser, filename, directory=None):
+	"""CarData from a file in a parser's data directory, via a cache."""
+	return _load(parser, filename, CarData, Parser.read_cardata,
+				 directory)
+
+
+def load_ferrydata(parser, filename, directory=None):
+	"""FerryData from a file in a parser's data directory, via a cache."""
+	return _load(parser, filename, FerryData, Parser.read_ferrydata,
+				 directory)
+
+
+def load_segmap(parser, car_filename, ferry_filename, directory=None):
+	"""SegmentMap from files in a parser's data directory, via caches.
+
+	The caches are in subdirectories of directory named for the files
+	(by default, .cache in the data directory). The map is built from
+	the cached columns, without decoding records (see
+	SegmentMap.from_columns).
+
+	"""
+	if directory is None:
+		directory = os.path.join(parser.path, '.cache')
+	cardata = load_cardata(parser, car_filename,
+						   os.path.join(directory, car_filename))
+	ferrydata = load_ferrydata(parser, ferry_filename,
+							   os.path.join(directory, ferry_filename))
+	if np is None:
+		return SegmentMap(cardata, ferrydata)
+	return SegmentMap.from_columns(cardata.arrays(), ferrydata.arrays())
+
+
+def _load(parser, filename, record_type, read, directory):
+	# Compiled records for a data file, (re)compiling the cache in
+	# directory (by default .cache in the data directory) if it's
+	# missing or stale. Records are read directly without NumPy.
+	if np is None:
+		return read(parser, filename)
+	source = os.path.join(parser.path, filename)
+	if directory is None:
+		directory = os.path.join(parser.path, '.cache', filename)
+	data = CompiledData.load(directory, source, parser.location)
+	if data is None:
+		data = CompiledData.from_records(record_type,
+										 read(_raw(parser), filename))
+		data.save(directory, source)
+		data.location = parser.location
+	return data
+
+
+class _Towns(dict):
+	# Location table resolving every town to its name.
+	def get(self, town, default=None):
+		return town
+
+
+def _raw(parser):
+	# Copy of a parser yielding town names rather than Locations.
+	raw = copy.copy(parser)
+	raw.location = _Towns()
+	return raw
+
+
+def _table(ids):
+	# Values of an ID mapping, ordered by ID.
+	return [value for value, _ in sorted(ids.items(),
+										 key=lambda item: item[1])]
+
+
+def _stat(path):
+	# Size and modification time identifying a version of a file.
+	stat = os.stat(path)
+	return [stat.st_size, stat.st_mtime]
+
+
+def _native(string):
+	# JSON strings are unicode; use native (byte) strings as parsed.
+	if not isinstance(string, str):
+		return string.encode('utf-8')
+	return string
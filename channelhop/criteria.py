@@ -0,0 +1,208 @@
+"""Module for criteria used to constrain trip options.
+
+A criterion is a predicate over `travel.Option` instances: calling it
+with an option returns True if the option should be kept. Criteria
+also provide the equivalent vectorised test over the columns of a
+`travel.OptionTable` via `mask`.
+
+Criteria compose with `&`, so several can be applied together in a
+single pass over the options:
+
+	>>> trip.constrain(MaxCost(120) & MaxDrive(timedelta(hours=4)))
+
+The string-based criteria accepted by `Trip.constrain` map onto these
+classes (see CRITERIA).
+
+"""
+from datetime import timedelta
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+
+class Criterion(object):
+	"""Base class for option criteria.
+
+	The name identifies the constraint on a Trip, so constraining
+	with a criterion of the same name replaces it.
+
+	"""
+	name = None
+
+	def __call__(self, option):
+		"""Return True if the option satisfies the criterion."""
+		raise NotImplementedError
+
+	def mask(self, table):
+		"""Boolean array of OptionTable rows satisfying the criterion."""
+		raise NotImplementedError
+
+	def __and__(self, other):
+		return All(self, other)
+
+
+class All(Criterion):
+	"""Conjunction of criteria.
+
+	Nested conjunctions are flattened and each option is tested
+	against every criterion in turn, stopping at the first failure.
+
+	"""
+	def __init__(self, *criteria):
+		self.criteria = []
+		for criterion in criteria:
+			if isinstance(criterion, All):
+				self.criteria.extend(criterion.criteria)
+			else:
+				self.criteria.append(criterion)
+
+	@property
+	def name(self):
+		return '&'.join(str(c.name) for c in self.criteria)
+
+	def __call__(self, option):
+		for criterion in self.criteria:
+			if not criterion(option):
+				return False
+		return True
+
+	def mask(self, table):
+		result = np.ones(len(table.cost), dtype=bool)
+		for criterion in self.criteria:
+			result &= criterion.mask(table)
+		return result
+
+
+class ArriveBy(Criterion):
+	"""Latest destination arrival, per arrival date.
+
+	Each datetime constrains options arriving on the same date; other
+	arrival dates are unaffected. Where several datetimes share a
+	date the first is used.
+
+		datetimes : sequence of datetime.datetime instances
+		buffer : tolerance (default 90 minutes)
+
+	"""
+	name = 'arrival'
+
+	def __init__(self, datetimes, buffer=timedelta(minutes=90)):
+		self.limits = dict((dt.date(), dt + buffer)
+						   for dt in reversed(datetimes))
+
+	def __call__(self, option):
+		dt = self.limits.get(option.arrival_time.date())
+		return dt is None or option.arrival_time <= dt
+
+	def mask(self, table):
+		dates = table.arrival.astype('datetime64[D]')
+		result = np.ones(len(dates), dtype=bool)
+		for date, dt in self.limits.items():
+			result &= ((dates != np.datetime64(date)) |
+					   (table.arrival <= np.datetime64(dt)))
+		return result
+
+
+class MaxDrive(Criterion):
+	"""Maximum post-ferry outward driving duration.
+
+		duration : datetime.timedelta instance
+		buffer : tolerance (default 30 minutes)
+
+	"""
+	name = 'drive'
+
+	def __init__(self, duration, buffer=timedelta(minutes=30)):
+		self.limit = duration + buffer
+
+	def __call__(self, option):
+		return option.out[-2].duration <= self.limit
+
+	def mask(self, table):
+		return table.drive <= np.timedelta64(self.limit)
+
+
+class DepartAfter(Criterion):
+	"""Earliest destination departure (start of the return).
+
+		dt : datetime.datetime instance
+		buffer : tolerance (default 60 minutes)
+
+	"""
+	name = 'destdep'
+
+	def __init__(self, dt, buffer=timedelta(minutes=60)):
+		self.limit = dt - buffer
+
+	def __call__(self, option):
+		return option.rtn[0].datetime >= self.limit
+
+	def mask(self, table):
+		return table.destdep >= np.datetime64(self.limit)
+
+
+class ReturnBy(Criterion):
+	"""Latest origin arrival (end of the return).
+
+		dt : datetime.datetime instance
+		buffer : tolerance (default 60 minutes)
+
+	"""
+	name = 'return'
+
+	def __init__(self, dt, buffer=timedelta(minutes=60)):
+		self.limit = dt + buffer
+
+	def __call__(self, option):
+		return option.rtn[-1].datetime <= self.limit
+
+	def mask(self, table):
+		return table.rtn_arrival <= np.datetime64(self.limit)
+
+
+class MaxCost(Criterion):
+	"""Maximum option cost.
+
+		cost : numeric value
+		buffer : tolerance (default 10.0)
+
+	"""
+	name = 'cost'
+
+	def __init__(self, cost, buffer=10.0):
+		self.limit = cost + buffer
+
+	def __call__(self, option):
+		return option.cost <= self.limit
+
+	def mask(self, table):
+		return table.cost <= self.limit
+
+
+# Criteria recognised by name, mapped to a constructor taking the
+# sequence of values passed to Trip.constrain.
+CRITERIA = {
+		'arrival' : ArriveBy,
+		'drive'   : lambda values: MaxDrive(values[0]),
+		'destdep' : lambda values: DepartAfter(values[0]),
+		'return'  : lambda values: ReturnBy(values[0]),
+		'cost'    : lambda values: MaxCost(values[0])
+		}
+
+
+def from_name(name, values):
+	"""Create a criterion from a recognised name and values."""
+	try:
+		factory = CRITERIA[name]
+	except KeyError:
+		raise ValueError("Unrecognised criteria: {}".format(name))
+	return factory(values)
+
+
+def compile_criteria(criteria):
+	"""Combine a criterion or sequence of criteria into one."""
+	if isinstance(criteria, Criterion):
+		return criteria
+	return All(*criteria)
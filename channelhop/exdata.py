@@ -11,9 +11,16 @@ the user (i.e. me).
 """
 import os
 import csv
+from multiprocessing import Pool, cpu_count
 from collections import namedtuple, defaultdict
 from datetime import timedelta, datetime
 from places import LocationMap
+from pareto import frontier
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
 
 FerryData = namedtuple('FerryData', 
 					   ['source',
@@ -33,17 +40,45 @@ CarData = namedtuple('CarData',
 					  'note'])
 
 class Parser(object):
-	"""Convert spreadsheet/CSV style data into native form."""
+	"""Convert spreadsheet/CSV style data into native form.
+
+	Records are read with the csv module, so quoted fields (e.g. notes
+	containing commas) are supported. Data files in the data directory
+	can be read incrementally, yielding records as they're parsed:
+
+		>>> parser = Parser(lmap)
+		>>> segmap = SegmentMap(parser.read_cardata('car.csv'),
+		...						parser.read_ferrydata('ferry.csv'))
+
+	Large datasets can be parsed in bulk (requires NumPy): each field
+	is converted for all rows at once into arrays (datetime64 and
+	timedelta64 for times), and malformed rows are collected rather
+	than raising an error:
+
+		>>> cd, car_errors = parser.bulk_cardata(car_lines)
+		>>> fd, ferry_errors = parser.bulk_ferrydata(ferry_lines)
+		>>> segmap = SegmentMap.from_columns(cd, fd)
+
+	parse_bulk gives the same data as records, for other consumers.
+
+	"""
 	def __init__(self, lmap, tests=False):
 
 		if tests:
 			rel_path = ('tests', 'data')
 		else:
-			rel_path = ('data')
+			rel_path = ('data',)
 		self.path = os.path.join(os.path.dirname(__file__), *rel_path)
 		self.lmap = lmap
 		self.location = {loc.town:loc for loc in lmap.locations}
 
+	def __getstate__(self):
+		# Pickled for worker processes (see read_files) without the
+		# location map; Locations are interned again when unpickled.
+		state = self.__dict__.copy()
+		state['lmap'] = None
+		return state
+
 	def parse(self, records):
 		"""Parse a dictionary of externally source route options.
 		
@@ -51,22 +86,143 @@ class Parser(object):
 		a list of CSV records in each.
 		
 		"""
-		to_cardata = self.to_cardata
-		to_ferrydata = self.to_ferrydata
-		cd = list()
-		for record in records['car']:
-			record = record.split(',')
-			route_pair = to_cardata(record)
-			for route in route_pair:
-				cd.append(route)
-		fd = list()
-		for record in records['ferry']:
-			record = record.split(',')
-			variants = to_ferrydata(record)
-			for variant in variants:
-				fd.append(variant)
+		cd = list(self.iter_cardata(records['car']))
+		fd = list(self.iter_ferrydata(records['ferry']))
 		return cd, fd
+
+	def iter_cardata(self, lines):
+		"""Yield CarData from CSV lines (e.g. an open file)."""
+		for row in csv.reader(lines):
+			if row:
+				for route in self.to_cardata(row):
+					yield route
+
+	def iter_ferrydata(self, lines):
+		"""Yield FerryData from CSV lines (e.g. an open file)."""
+		for row in csv.reader(lines):
+			if row:
+				for variant in self.to_ferrydata(row):
+					yield variant
+
+	def read_cardata(self, filename):
+		"""Yield CarData from a CSV file in the data directory."""
+		with open(os.path.join(self.path, filename), 'rb') as f:
+			for route in self.iter_cardata(f):
+				yield route
+
+	def read_ferrydata(self, filename):
+		"""Yield FerryData from a CSV file in the data directory."""
+		with open(os.path.join(self.path, filename), 'rb') as f:
+			for variant in self.iter_ferrydata(f):
+				yield variant
 	
+	def parse_bulk(self, records):
+		"""Parse a dictionary of records in bulk.
+
+		As parse, but CarData and FerryData are generated from
+		columns parsed in bulk (see bulk_cardata/bulk_ferrydata).
+		Also returns a dictionary ('car', 'ferry') of malformed
+		records (see bulk_cardata), which are skipped.
+
+		"""
+		car_columns, car_errors = self.bulk_cardata(records['car'])
+		ferry_columns, ferry_errors = self.bulk_ferrydata(
+				records['ferry'])
+		errors = {'car' : car_errors, 'ferry' : ferry_errors}
+		return (iter_records(CarData, car_columns),
+				iter_records(FerryData, ferry_columns), errors)
+
+	def bulk_cardata(self, lines):
+		"""Parse CSV lines into CarData columns.
+
+		Returns a dictionary of arrays, keyed by CarData field, with
+		two rows per record as for to_cardata, and a list of
+		(row number, message) tuples for malformed records (which are
+		skipped). Row numbers count from 1, including blank lines.
+
+		"""
+		numbers, columns, errors = self._columns(lines, 6)
+		valid = np.ones(len(numbers), dtype=bool)
+		towns = columns[:2]
+		distance = _floats(columns[2], 'distance', numbers, valid,
+						   errors)
+		duration = _durations(columns[3], numbers, valid, errors)
+		cost = _floats(columns[4], 'cost', numbers, valid, errors)
+		note = columns[5]
+		source, destination = [self._locations(col[valid])
+							   for col in towns]
+		# each record is followed by its reverse
+		fields = (distance[valid], duration[valid], cost[valid],
+				  note[valid])
+		forward = (source, destination) + fields
+		reverse = (destination, source) + fields
+		result = {}
+		for field, col, rev in zip(CarData._fields, forward, reverse):
+			result[field] = np.column_stack((col, rev)).ravel()
+		return result, _sorted(errors)
+
+	def bulk_ferrydata(self, lines):
+		"""Parse CSV lines into FerryData columns.
+
+		Returns a dictionary of arrays, keyed by FerryData field,
+		with cabin variants as for to_ferrydata, and a list of
+		(row number, message) tuples for malformed records (see
+		bulk_cardata). Dates must be ISO (YYYY-MM-DD) and times HH:MM.
+
+		"""
+		numbers, columns, errors = self._columns(lines, 10)
+		valid = np.ones(len(numbers), dtype=bool)
+		dep = _datetimes(columns[3], columns[4], 'departure', numbers,
+						 valid, errors)
+		arr = _datetimes(columns[5], columns[6], 'arrival', numbers,
+						 valid, errors)
+		cost = _floats(columns[7], 'cost', numbers, valid, errors)
+		accom_cost = _floats(columns[8], 'accommodation cost',
+							 numbers, valid, errors)
+		# one row per record, plus one per cabin variant
+		counts = np.where(accom_cost[valid] > 0, 2, 1)
+		rows = np.repeat(np.flatnonzero(valid), counts)
+		cabin = np.zeros(len(rows), dtype=bool)
+		cabin[np.cumsum(counts)[counts == 2] - 1] = True
+		note = columns[9][rows]
+		result = {
+				'source' : self._locations(columns[0][rows]),
+				'destination' : self._locations(columns[1][rows]),
+				'operator' : columns[2][rows],
+				'dep' : dep[rows],
+				'arr' : arr[rows],
+				'cost' : cost[rows] + np.where(cabin, accom_cost[rows], 0),
+				'note' : np.where(cabin, np.char.add(note, 'Cabin'), '')
+				}
+		return result, _sorted(errors)
+
+	def _columns(self, lines, nfields):
+		# Row numbers and string columns of the CSV rows with nfields
+		# fields; other (non-blank) rows are recorded as errors.
+		if np is None:
+			raise ImportError("Bulk parsing requires numpy.")
+		numbers, rows, errors = [], [], []
+		for number, row in enumerate(csv.reader(lines), 1):
+			if not row:
+				continue
+			if len(row) != nfields:
+				errors.append((number, 'expected {} fields, got {}'
+							   .format(nfields, len(row))))
+				continue
+			numbers.append(number)
+			rows.append(row)
+		table = np.array(rows, dtype=str).reshape(len(rows), nfields)
+		return numbers, list(table.T), errors
+
+	def _locations(self, towns):
+		# Object array of Locations for an array of towns (None where
+		# the town isn't recognised).
+		unique, inverse = np.unique(towns, return_inverse=True)
+		table = np.empty(len(unique), dtype=object)
+		for i, town in enumerate(unique):
+			table[i] = self.location.get(town)
+		return table[inverse]
+
 	def to_cardata(self, row):
 		"""Parse an external data record into two CarData."""
 		source, destination = map(self.location.get, row[:2])
@@ -103,3 +259,159 @@ class Parser(object):
 			fd.append(FerryData(source, destination, operator, dep,
 								arr, cost, note))
 		return fd
+
+
+def read_files(parser, car_files=(), ferry_files=(), processes=None):
+	"""Read many data files in parallel.
+
+	Files (in the parser's data directory) are read in a pool of
+	processes (by default, one per CPU), a file per task. Returns a
+	list of the CarData and a list of the FerryData of all files, in
+	file order. With one process (or file) the files are read in
+	turn, avoiding the cost of passing records between processes.
+
+	"""
+	tasks = ([(parser, 'car', name) for name in car_files] +
+			 [(parser, 'ferry', name) for name in ferry_files])
+	if processes is None:
+		processes = cpu_count()
+	processes = min(processes, len(tasks))
+	if processes <= 1:
+		results = map(_read_file, tasks)
+	else:
+		pool = Pool(processes)
+		try:
+			results = pool.map(_read_file, tasks, chunksize=1)
+		finally:
+			pool.close()
+			pool.join()
+	cd, fd = [], []
+	for (_, kind, _), records in zip(tasks, results):
+		if kind == 'car':
+			cd.extend(records)
+		else:
+			fd.extend(records)
+	return cd, fd
+
+
+def prune_cardata(records):
+	"""Drop dominated car route variants.
+
+	A variant is dominated if another between the same locations is
+	no longer and no more expensive (and better in one). Returns the
+	remaining records, in their original order, and the number
+	dropped.
+
+	"""
+	return _prune(records, lambda r: r[:2],
+				  lambda r: (r.duration, r.cost))
+
+
+def prune_ferrydata(records):
+	"""Drop dominated sailings.
+
+	A sailing is dominated if another between the same ports, with
+	the same note (e.g. cabin variants) and departure date, leaves no
+	earlier, arrives no later and costs no more (and is better in
+	one): any connection made by the dominated sailing is also made
+	by the other. Returns as prune_cardata.
+
+	"""
+	return _prune(records, lambda r: r[:2] + (r.note, r.dep.date()),
+				  lambda r: (datetime.max - r.dep, r.arr, r.cost))
+
+
+def _prune(records, group, key):
+	# Records on the frontier of their group, by key (minimised).
+	records = list(records)
+	groups = defaultdict(list)
+	for record in records:
+		groups[group(record)].append(record)
+	kept = set()
+	for members in groups.values():
+		kept.update(id(r) for r in frontier(members, key))
+	result = [record for record in records if id(record) in kept]
+	return result, len(records) - len(result)
+
+
+def _read_file(task):
+	# Records of one data file; a pool worker, so module-level.
+	parser, kind, filename = task
+	if kind == 'car':
+		return list(parser.read_cardata(filename))
+	return list(parser.read_ferrydata(filename))
+
+
+def iter_records(record_type, columns):
+	"""Yield records from columns parsed in bulk (see Parser)."""
+	fields = []
+	for field in record_type._fields:
+		column = columns[field]
+		if column.dtype.kind in 'mM':
+			column = column.astype(object) # datetime/timedelta
+		fields.append(column.tolist())
+	for values in zip(*fields):
+		yield record_type(*values)
+
+
+def _floats(strings, name, numbers, valid, errors):
+	# Float array of strings, converted in one step where possible.
+	# Malformed values are 0.0, recorded as errors and marked invalid.
+	try:
+		return strings.astype(float)
+	except ValueError:
+		pass
+	result = np.zeros(len(strings))
+	for i, string in enumerate(strings):
+		try:
+			result[i] = float(string)
+		except ValueError:
+			_invalid(i, 'bad {}: {!r}'.format(name, string), numbers,
+					 valid, errors)
+	return result
+
+
+def _datetimes(dates, times, name, numbers, valid, errors):
+	# datetime64 (minutes) array of ISO date and time strings, as
+	# _floats. Malformed values are NaT.
+	strings = np.char.add(np.char.add(dates, 'T'), times)
+	try:
+		return strings.astype('datetime64[m]')
+	except ValueError:
+		pass
+	result = np.empty(len(strings), dtype='datetime64[m]')
+	for i, string in enumerate(strings):
+		try:
+			result[i] = np.datetime64(string, 'm')
+		except ValueError:
+			result[i] = np.datetime64('NaT')
+			_invalid(i, 'bad {}: {!r}'.format(name, string), numbers,
+					 valid, errors)
+	return result
+
+
+def _durations(strings, numbers, valid, errors):
+	# timedelta64 (minutes) array of HH:MM strings, as _floats.
+	if not len(strings):
+		return np.array([], dtype='timedelta64[m]')
+	parts = np.char.partition(strings, ':')
+	hours, minutes = parts[:, 0], parts[:, 2]
+	ok = (np.char.isdigit(hours) & np.char.isdigit(minutes) &
+		  (parts[:, 1] == ':'))
+	for i in np.flatnonzero(~ok):
+		_invalid(i, 'bad duration: {!r}'.format(strings[i]), numbers,
+				 valid, errors)
+	hours = np.where(ok, hours, '0').astype(int)
+	minutes = np.where(ok, minutes, '0').astype(int)
+	return (hours * 60 + minutes).astype('timedelta64[m]')
+
+
+def _invalid(i, message, numbers, valid, errors):
+	# Record a malformed value in row i of the parsed rows.
+	valid[i] = False
+	errors.append((numbers[i], message))
+
+
+def _sorted(errors):
+	# Errors in row order (one row may have several).
+	return sorted(errors, key=lambda error: error[0])
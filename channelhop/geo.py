@@ -0,0 +1,123 @@
+"""Module for geographic distances and spatial indexing.
+
+Coordinates are (latitude, longitude) pairs in degrees. Distances are
+great-circle distances in km.
+
+A SpatialIndex (k-d tree) answers nearest-neighbour and radius
+queries over located items, e.g. the ports of a network:
+
+	>>> index = SpatialIndex((coordinates[port], port) for port in ports)
+	>>> index.nearest(coordinates[origin], k=3)
+
+"""
+import heapq
+import math
+
+EARTH_RADIUS = 6371.0 # km
+
+
+def distance(a, b):
+	"""Great-circle distance (km) between two coordinates."""
+	lat1, lon1 = map(math.radians, a)
+	lat2, lon2 = map(math.radians, b)
+	h = (math.sin((lat2 - lat1) / 2) ** 2 +
+		 math.cos(lat1) * math.cos(lat2) *
+		 math.sin((lon2 - lon1) / 2) ** 2)
+	return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(h)))
+
+
+def _cartesian(coordinates):
+	# Unit vector for coordinates. Straight-line (chord) distances
+	# between unit vectors order points as great-circle distances do.
+	lat, lon = map(math.radians, coordinates)
+	return (math.cos(lat) * math.cos(lon),
+			math.cos(lat) * math.sin(lon),
+			math.sin(lat))
+
+
+def _chord(km):
+	# Chord length (on the unit sphere) of a great-circle distance.
+	angle = min(km / EARTH_RADIUS, math.pi)
+	return 2 * math.sin(angle / 2)
+
+
+class SpatialIndex(object):
+	"""A k-d tree of located items.
+
+		items : iterable of (coordinates, item) pairs
+
+	Points are held as unit vectors, so queries are unaffected by
+	longitude wrap-around. The index is static; create a new one if
+	the items change.
+
+	"""
+	def __init__(self, items):
+		points = [(_cartesian(coordinates), item)
+				  for coordinates, item in items]
+		self.items = [item for _, item in points]
+		self._root = self._build(points, 0)
+
+	def __len__(self):
+		return len(self.items)
+
+	def _build(self, points, axis):
+		# Nodes are (point, item, axis, left, right) tuples, split on
+		# the median along each axis in turn.
+		if not points:
+			return None
+		points.sort(key=lambda p: p[0][axis])
+		mid = len(points) // 2
+		next_axis = (axis + 1) % 3
+		return (points[mid][0], points[mid][1], axis,
+				self._build(points[:mid], next_axis),
+				self._build(points[mid+1:], next_axis))
+
+	def nearest(self, coordinates, k=1):
+		"""The k items nearest to coordinates, nearest first."""
+		heap = [] # (-squared chord, sequence, item), furthest first
+		if k > 0:
+			self._nearest(self._root, _cartesian(coordinates), k, heap)
+		return [item for _, _, item in sorted(heap, reverse=True)]
+
+	def _nearest(self, node, target, k, heap):
+		# Depth-first search, visiting the far side of a split only if
+		# it could hold a point nearer than the kth found so far.
+		if node is None:
+			return
+		point, item, axis, left, right = node
+		d2 = _squared(point, target)
+		if len(heap) < k:
+			heapq.heappush(heap, (-d2, -len(heap), item))
+		elif d2 < -heap[0][0]:
+			heapq.heapreplace(heap, (-d2, heap[0][1], item))
+		diff = target[axis] - point[axis]
+		near, far = (left, right) if diff < 0 else (right, left)
+		self._nearest(near, target, k, heap)
+		if len(heap) < k or diff * diff < -heap[0][0]:
+			self._nearest(far, target, k, heap)
+
+	def within(self, coordinates, radius):
+		"""Items within radius (km) of coordinates."""
+		result = []
+		chord = _chord(radius)
+		self._within(self._root, _cartesian(coordinates), chord ** 2,
+					 result)
+		return result
+
+	def _within(self, node, target, limit, result):
+		# Collect items within the squared chord limit.
+		if node is None:
+			return
+		point, item, axis, left, right = node
+		if _squared(point, target) <= limit:
+			result.append(item)
+		diff = target[axis] - point[axis]
+		if diff < 0 or diff * diff <= limit:
+			self._within(left, target, limit, result)
+		if diff >= 0 or diff * diff <= limit:
+			self._within(right, target, limit, result)
+
+
+def _squared(a, b):
+	# Squared straight-line distance between vectors.
+	return sum((x - y) ** 2 for x, y in zip(a, b))
@@ -0,0 +1,129 @@
+"""Module for Pareto-frontier (skyline) computation.
+
+Given a collection of items and a key returning a tuple of criteria
+values (all minimised), the frontier is the set of items not
+dominated by any other. An item dominates another if it is no worse
+in every criterion and strictly better in at least one.
+
+	>>> frontier(trip.options, key=lambda o: (o.cost, o.arrival_time))
+
+The implementation is sort-based divide-and-conquer: points are
+sorted lexicographically, so a point can only be dominated by points
+before it. Each half is reduced to its own skyline and the right half
+is then filtered against the left, which only needs the remaining
+criteria (for three criteria, a two-dimensional staircase query).
+
+"""
+import bisect
+
+# Below this size a block is reduced by direct comparison.
+_BLOCK = 256
+
+
+def frontier(items, key):
+	"""Return the non-dominated items, ordered by key.
+
+		items : iterable of items
+		key : callable returning a tuple of comparable values
+
+	Items sharing identical key values don't dominate each other;
+	they are either all on the frontier or all off it.
+
+	"""
+	groups = {}
+	for item in items:
+		groups.setdefault(key(item), []).append(item)
+	result = []
+	for point in skyline(sorted(groups)):
+		result.extend(groups[point])
+	return result
+
+
+def skyline(points):
+	"""Skyline of distinct, lexicographically sorted tuples."""
+	if len(points) <= _BLOCK:
+		return _block_skyline(points)
+	mid = len(points) // 2
+	left = skyline(points[:mid])
+	right = skyline(points[mid:])
+	return left + _filter(left, right)
+
+
+def _block_skyline(points):
+	# Direct comparison against the points kept so far (a staircase
+	# for three criteria).
+	if points and len(points[0]) == 3:
+		stairs = _Staircase(())
+		kept = []
+		for point in points:
+			if not stairs.dominates(point[1:]):
+				stairs.add(point[1:])
+				kept.append(point)
+		return kept
+	kept = []
+	for point in points:
+		if not any(_weakly_dominates(other[1:], point[1:])
+				   for other in kept):
+			kept.append(point)
+	return kept
+
+
+def _filter(left, right):
+	# Right-hand points not dominated by any left-hand point. Left
+	# points precede right points, so the first criterion is never
+	# worse and only the remainder need comparing.
+	if not left or not right:
+		return right
+	dims = len(right[0])
+	if dims == 1:
+		return []
+	elif dims == 2:
+		best = min(point[1] for point in left)
+		return [point for point in right if point[1] < best]
+	elif dims == 3:
+		stairs = _Staircase(point[1:] for point in left)
+		return [point for point in right
+				if not stairs.dominates(point[1:])]
+	return [point for point in right
+			if not any(_weakly_dominates(other[1:], point[1:])
+					   for other in left)]
+
+
+def _weakly_dominates(a, b):
+	# True if a is no worse than b in every criterion.
+	for x, y in zip(a, b):
+		if x > y:
+			return False
+	return True
+
+
+class _Staircase(object):
+	"""Minimal (y, z) pairs for two-dimensional dominance queries.
+
+	Pairs are held in ascending y with strictly descending z, so the
+	pair with the largest y not exceeding a query y also has the
+	smallest z of all candidates.
+
+	"""
+	def __init__(self, pairs):
+		self.ys, self.zs = [], []
+		for y, z in sorted(pairs):
+			if not self.zs or z < self.zs[-1]:
+				self.ys.append(y)
+				self.zs.append(z)
+
+	def add(self, pair):
+		"""Add a pair, dropping any stored pairs it dominates."""
+		y, z = pair
+		i = bisect.bisect_left(self.ys, y)
+		j = i
+		while j < len(self.ys) and self.zs[j] >= z:
+			j += 1
+		self.ys[i:j] = [y]
+		self.zs[i:j] = [z]
+
+	def dominates(self, pair):
+		"""True if a stored pair is no worse in both criteria."""
+		y, z = pair
+		i = bisect.bisect_right(self.ys, y) - 1
+		return i >= 0 and self.zs[i] <= z
@@ -2,23 +2,82 @@
 
 The definition of a transport network here is crude:
 
-Given an origin in the UK and a destination in FR (this is relatively
-arbitrary but the only tested case) the transport network is a simple
-graph
+Given an origin and a destination in different countries (by default
+the UK and FR) the transport network is a simple graph
 
-	origin 1...1+ UK Ports 1+...1+ FR Ports 1+...1 destination
+	origin 1...1+ Origin Ports 1+...1+ Dest. Ports 1+...1 destination
+
+where ports are paired by the ferry routes of a PortNetwork. A
+network may span several countries; paths through ports in other
+countries are limited by the number of border crossings allowed.
 
 """
 from collections import namedtuple
 from collections import defaultdict
+from datetime import timedelta
+
+from geo import SpatialIndex, distance
+
+# Registry of interned locations, by (town, country) (see Location).
+_locations = {}
 
 _Location = namedtuple('Location', 'town, country')
 class Location(_Location):
-	"""A simple representation of a place/location."""
+	"""A simple representation of a place/location.
+
+	Locations are interned: creating a location returns the existing
+	instance for its (town, country) if there is one, with interned
+	strings. Equal locations are then the same object, so lookups and
+	comparisons succeed on identity without comparing strings (and
+	country comparisons are identity checks too). Unpickled (with any
+	protocol) and copied locations are interned too. Locations still
+	equal (and hash as) plain tuples.
+
+	Coordinates aren't part of a location; they're given to the
+	PortNetwork or LocationMap using them (see PORT_COORDINATES).
+
+	"""
 	__slots__ = ()
+	def __new__(cls, town, country):
+		try:
+			return _locations[town, country]
+		except KeyError:
+			self = _Location.__new__(cls, _intern(town), _intern(country))
+			_locations[self.town, self.country] = self
+			return self
+
+	@classmethod
+	def _make(cls, iterable):
+		# Interned, like instantiation (used by _replace).
+		return cls(*iterable)
+
+	def __reduce__(self):
+		# Pickle (any protocol) and copy by instantiation, so that
+		# the result is interned.
+		return (Location, (self.town, self.country))
+
 	def __repr__(self):
 		return 'Location({!r}, {!r})'.format(self.town, self.country)
 
+
+def _intern(string):
+	# Interned copy of a (byte) string; other values are unchanged.
+	if type(string) is str:
+		return intern(string)
+	return string
+
+# Coordinates (latitude, longitude) of recognised ports
+PORT_COORDINATES = {
+		Location('Portsmouth', 'UK') : (50.80, -1.09),
+		Location('Poole', 'UK')      : (50.71, -1.99),
+		Location('Newhaven', 'UK')   : (50.79, 0.05),
+		Location('Le Havre', 'FR')   : (49.49, 0.11),
+		Location('St. Malo', 'FR')   : (48.65, -2.01),
+		Location('Cherbourg', 'FR')  : (49.64, -1.62),
+		Location('Caen', 'FR')       : (49.28, -0.25),
+		Location('Dieppe', 'FR')     : (49.93, 1.08)
+		}
+
 # Recognised ferry routes
 FERRY_ROUTES = [
 		(Location('Portsmouth', 'UK'), Location('Le Havre', 'FR')),
@@ -29,88 +88,294 @@ FERRY_ROUTES = [
 		(Location('Newhaven', 'UK'),   Location('Dieppe', 'FR'))
 		]
 
+# Standard-time offsets from UTC (hours) of recognised countries.
+# Ferry times are local, so crossings between countries with
+# different offsets are adjusted to give the true duration.
+UTC_OFFSETS = {
+		'UK' : 0, 'IE' : 0,
+		'FR' : 1, 'BE' : 1, 'NL' : 1, 'DE' : 1, 'ES' : 1,
+		'DK' : 1, 'NO' : 1, 'SE' : 1
+		}
+
+
+def time_difference(source_country, destination_country):
+	"""Local time difference between two countries (a timedelta).
+
+	Countries without a known offset are assumed to be on UTC.
+
+	"""
+	hours = (UTC_OFFSETS.get(destination_country, 0) -
+			 UTC_OFFSETS.get(source_country, 0))
+	return timedelta(hours=hours)
+
+
+class PortNetwork(object):
+	"""A network of ferry routes between ports.
+
+		>>> network = PortNetwork(FERRY_ROUTES, PORT_COORDINATES)
+
+	Routes are pairs of port Locations and run in both directions.
+	Coordinates, if given, map ports to (latitude, longitude) for
+	geographic filtering (see LocationMap); ports needn't be located.
+	The following lookup indexes are built once, on instantiation:
+
+		coordinates : dict of port -> (latitude, longitude)
+		ports : set of all ports
+		ports_by_country : dict of country -> set of ports
+		routes_by_port : dict of port -> set of paired ports
+
+	Port-to-port paths between countries are cached on first request
+	(see skeleton) and shared by every LocationMap using the network,
+	as are spatial indexes of located ports (see index), so a network
+	shouldn't be modified once created.
+
+	"""
+	def __init__(self, routes, coordinates=None):
+		self.routes = list(routes)
+		self.coordinates = dict(coordinates or {})
+		self.ports = set()
+		ports_by_country = defaultdict(set)
+		routes_by_port = defaultdict(set)
+		for route in self.routes:
+			for port, port2 in (route, route[::-1]):
+				self.ports.add(port)
+				ports_by_country[port.country].add(port)
+				routes_by_port[port].add(port2)
+		# plain dicts, so lookups don't add entries
+		self.ports_by_country = dict(ports_by_country)
+		self.routes_by_port = dict(routes_by_port)
+		self._skeletons = {}
+		self._indexes = {}
+
+	def index(self, country):
+		"""SpatialIndex of the located ports of a country (cached)."""
+		try:
+			return self._indexes[country]
+		except KeyError:
+			pass
+		ports = self.ports_by_country.get(country, ())
+		index = SpatialIndex((self.coordinates[port], port)
+							 for port in ports
+							 if port in self.coordinates)
+		self._indexes[country] = index
+		return index
+
+	def skeleton(self, source_country, destination_country,
+				 max_crossings=1):
+		"""Paths between the ports of two countries.
+
+		Returns a list of port tuples, each starting at a port in
+		source_country and ending at one in destination_country,
+		with at most max_crossings border crossings. Results are
+		cached.
+
+		"""
+		key = source_country, destination_country, max_crossings
+		try:
+			return self._skeletons[key]
+		except KeyError:
+			pass
+		paths = []
+		for port in self.ports_by_country.get(source_country, ()):
+			for path in _walk(self.routes_by_port, port, max_crossings):
+				if path[-1].country == destination_country:
+					paths.append(tuple(path))
+		self._skeletons[key] = paths
+		return paths
+
+
+DEFAULT_NETWORK = PortNetwork(FERRY_ROUTES, PORT_COORDINATES)
+
+
 class LocationMap(defaultdict):
 	"""Represent a simple route network.
 
-	This is a network map from a domestic origin, A, and international
-	destination, B represented as a simple undirected graph.
+	This is a network map from an origin, A, and a destination, B, in
+	another country, represented as a simple undirected graph.
 
 		>>> lmap = LocationMap('MyHouse', 'HolidayDest')
+		>>> lmap = LocationMap('MyHouse', 'Bilbao', 'UK', 'ES',
+		...					   network=PortNetwork(routes))
+
+	Origin and destination are town names in the given countries (by
+	default UK and FR), or Location instances. The endpoints are
+	connected to the ports of their own country and ports are
+	connected to their paired ports in the network. Paths with more
+	than max_crossings border crossings aren't considered; they are
+	the network's cached port paths with the endpoints attached.
+
+	Where endpoints have coordinates (given as a mapping of location
+	-> (latitude, longitude); ports are located by the network), the
+	ports they connect to can be restricted to the nearest (the
+	number given) and/or those within a detour ratio, i.e. where the
+	distance via the port is at most detour times the direct distance
+	between the endpoints. Ports without coordinates are never
+	excluded.
+
+		>>> brighton = Location('Brighton', 'UK')
+		>>> lmap = LocationMap(brighton, 'Rouen', nearest=2,
+		...					   coordinates={brighton : (50.82, -0.14)})
 
 	The following attributes are available after instantiation:
 
-		ports : dict containing ports
+		network : PortNetwork instance
+		coordinates : dict of location -> (latitude, longitude)
+		ports : dict containing ports, by country (and 'ALL')
 		origin : argument
 		destination : argument
 		endpoints : set(origin, destination)
+		candidates : dict of endpoint -> set of connected ports
 		locations : set of ports and endpoints
 		routes : dict containing list of routes (both out and rtn).
 
 	"""
-	# Available directly from the class.
-	ports = {}
-	ports['UK'] = set(route[0] for route in FERRY_ROUTES)
-	ports['FR'] = set(route[1] for route in FERRY_ROUTES)
-	ports['ALL'] = ports['UK'].union(ports['FR'])
+	# Ports of the default network, available directly from the class.
+	ports = dict(DEFAULT_NETWORK.ports_by_country)
+	ports['ALL'] = DEFAULT_NETWORK.ports
 
-	def __init__(self, origin, destination):
+	def __init__(self, origin, destination, origin_country='UK',
+				 destination_country='FR', network=DEFAULT_NETWORK,
+				 max_crossings=1, nearest=None, detour=None,
+				 coordinates=None):
 		defaultdict.__init__(self, set)
-		self.origin = Location(origin, 'UK')
-		self.destination = Location(destination, 'FR')
+		if not isinstance(origin, Location):
+			origin = Location(origin, origin_country)
+		if not isinstance(destination, Location):
+			destination = Location(destination, destination_country)
+		self.network = network
+		self.max_crossings = max_crossings
+		self.nearest = nearest
+		self.detour = detour
+		self.coordinates = dict(network.coordinates)
+		self.coordinates.update(coordinates or {})
+		self.ports = dict(network.ports_by_country)
+		self.ports['ALL'] = network.ports
+		self.origin = origin
+		self.destination = destination
 		self.endpoints = set([self.origin, self.destination])
-		self.locations = self.ports['ALL'].union(self.endpoints)
+		self.locations = network.ports.union(self.endpoints)
+		self.candidates = {
+				origin : self._candidate_ports(origin, destination),
+				destination : self._candidate_ports(destination, origin)
+				}
 
 		self._connect_ports()
 		self._connect_endpoints()
 		self._find_paths()
 
+	def _candidate_ports(self, endpoint, other):
+		# ports an endpoint may connect to, filtered geographically
+		# if requested and the endpoint is located
+		ports = self.network.ports_by_country.get(endpoint.country, ())
+		coordinates = self.network.coordinates
+		here = self.coordinates.get(endpoint)
+		if here is None or (self.nearest is None and
+							self.detour is None):
+			return set(ports)
+		index = self.network.index(endpoint.country)
+		located = set(index.items)
+		if self.nearest is not None:
+			located = set(index.nearest(here, self.nearest))
+		there = self.coordinates.get(other)
+		if self.detour is not None and there is not None:
+			limit = self.detour * distance(here, there)
+			located.intersection_update(index.within(here, limit))
+			located = set(port for port in located
+						  if distance(here, coordinates[port]) +
+						  distance(coordinates[port], there) <= limit)
+		return located.union(port for port in ports
+							 if port not in coordinates)
+
 	def _connect_ports(self):
 		# evaluate neighbours based on ferry routes
-		for route in FERRY_ROUTES:
-			for diroute in (route, route[::-1]):
-				port, port2 = diroute
-				if port.country is self.origin.country:
-					self[port].add(self.origin)
-				else:
-					self[port].add(self.destination)
-				self[port].add(port2)    # add paired port
+		for port, paired in self.network.routes_by_port.items():
+			for endpoint in self.endpoints:
+				if port in self.candidates[endpoint]:
+					self[port].add(endpoint)
+			self[port].update(paired)    # add paired ports
 
 	def _connect_endpoints(self):
 		# evaluate neighbours of origin and destination
 		for location in self.endpoints:
-			self[location].update(self.ports[location.country])
+			self[location].update(self.candidates[location])
 
 	def _find_paths(self):
 		# find all outward and return routes
 		a, b = self.origin, self.destination
 		d = {}
-		d['OUT'] = filter(has_single_crossing, find_paths(self, a, b))
-		d['RTN'] = filter(has_single_crossing, find_paths(self, b, a))
+		d['OUT'] = self._splice(a, b)
+		d['RTN'] = self._splice(b, a)
 		self.paths = d
 
+	def _splice(self, start, end):
+		# paths between endpoints via the network's cached port paths
+		# (searched directly if an endpoint is itself a port)
+		if start == end or self.endpoints & self.network.ports:
+			return find_paths(self, start, end, self.max_crossings)
+		skeleton = self.network.skeleton(start.country, end.country,
+										 self.max_crossings)
+		first, last = self.candidates[start], self.candidates[end]
+		return [[start] + list(ports) + [end] for ports in skeleton
+				if ports[0] in first and ports[-1] in last]
 
-def find_paths(lmap, start, end, path=[]):
-	"""Find all paths in a location map between two locations."""
-	path = path + [start] # Add the start node to the current path
+
+def find_paths(lmap, start, end, max_crossings=None):
+	"""Find all paths in a location map between two locations.
+
+	Paths are found by an iterative depth-first search. If
+	max_crossings is given, paths crossing between countries more
+	often than that aren't explored.
+
+	"""
 	if start == end:
-		return [path]
-	if not lmap.has_key(start):
+		return [[start]]
+	if start not in lmap:
 		# invalid start node
 		raise ValueError('Start location not in lmap')
-	
-	paths = [] # container for all paths
-	for neighbour in filter(lambda l: l not in path, lmap[start]):
-		# for each UNVISITED neighbour, find paths and store
-		newpaths = find_paths(lmap, neighbour, end, path)
-		for newpath in newpaths:
-			paths.append(newpath)
-	return paths
+	return [list(path) for path in _walk(lmap, start, max_crossings, end)
+			if path[-1] == end]
+
+def _walk(graph, start, max_crossings=None, end=None):
+	# Iterative depth-first walk over the simple paths from start in
+	# a graph (mapping of location -> neighbours), yielding the path
+	# on reaching each location. The path list is shared; copy it to
+	# keep it. Paths aren't extended beyond the end location or past
+	# max_crossings border crossings.
+	path, visited = [start], set([start])
+	crossings = [0] # crossings along the path, by position
+	stack = [iter(graph.get(start, ()))] # unexplored neighbours
+	yield path
+	while stack:
+		for neighbour in stack[-1]:
+			if neighbour in visited:
+				continue
+			count = crossings[-1]
+			if neighbour.country != path[-1].country:
+				count += 1
+				if max_crossings is not None and count > max_crossings:
+					continue
+			path.append(neighbour)
+			if neighbour == end:
+				yield path
+				path.pop()
+				continue
+			# descend to the UNVISITED neighbour
+			visited.add(neighbour)
+			crossings.append(count)
+			stack.append(iter(graph.get(neighbour, ())))
+			yield path
+			break
+		else:
+			# neighbours exhausted; backtrack
+			stack.pop()
+			visited.remove(path.pop())
+			crossings.pop()
 
 def has_single_crossing(path):
 	"""Evaluate whether path has a single crossing."""
 	result, crossings, last_node = True, 0, path[0]
 	for node in path[1:]:
-		if node.country is not last_node.country:
+		if node.country != last_node.country:
 			crossings += 1
 			last_node = node
 	if crossings > 1: result = False
@@ -0,0 +1,119 @@
+import unittest
+import os
+import shutil
+import tempfile
+from channelhop.cache import CompiledData, load_cardata, load_ferrydata
+from channelhop.cache import load_segmap
+from channelhop.cache import np
+from channelhop.exdata import Parser, FerryData
+from channelhop.travel import SegmentMap
+from channelhop.places import LocationMap
+
+
+@unittest.skipIf(np is None, "NumPy not available")
+class TestCompiledData(unittest.TestCase):
+	def setUp(self):
+		self.parser = Parser(LocationMap('A', 'B'), tests=True)
+		self.ferrydata = list(self.parser.read_ferrydata('ferry.csv'))
+		self.cardata = list(self.parser.read_cardata('car.csv'))
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_roundtrip(self):
+		data = CompiledData.from_records(FerryData, self.ferrydata)
+		self.assertEqual(len(data), 9)
+		self.assertEqual(list(data), self.ferrydata)
+		data.save(self.directory)
+		loaded = CompiledData.load(self.directory,
+								   location=self.parser.location)
+		self.assertEqual(list(loaded), self.ferrydata)
+		self.assertIsInstance(loaded.columns['dep'], np.memmap)
+
+	def test_locations_interned(self):
+		data = CompiledData.from_records(FerryData, self.ferrydata)
+		data.save(self.directory)
+		record = next(iter(CompiledData.load(
+				self.directory, location=self.parser.location)))
+		self.assertIs(record.source, self.ferrydata[0].source)
+
+	def test_towns_unresolved(self):
+		"""Without a location table, towns are loaded by name."""
+		data = CompiledData.from_records(FerryData, self.ferrydata)
+		data.save(self.directory)
+		record = next(iter(CompiledData.load(self.directory)))
+		self.assertEqual(record.source, self.ferrydata[0].source.town)
+
+	def test_other_location_map(self):
+		"""A cache is resolved by the loading parser's locations."""
+		load_cardata(self.parser, 'car.csv', self.directory)
+		parser = Parser(LocationMap('Z', 'B'), tests=True)
+		cardata = load_cardata(parser, 'car.csv', self.directory)
+		self.assertIsInstance(cardata.columns['cost'], np.memmap)
+		self.assertEqual(list(cardata),
+						 list(parser.read_cardata('car.csv')))
+		self.assertIsNone(next(iter(cardata)).source) # town A
+		cardata = load_cardata(self.parser, 'car.csv', self.directory)
+		self.assertEqual(list(cardata), self.cardata)
+
+	def test_load_via_cache(self):
+		cardata = load_cardata(self.parser, 'car.csv', self.directory)
+		self.assertEqual(list(cardata), self.cardata)
+		self.assertTrue(os.path.exists(
+				os.path.join(self.directory, 'manifest.json')))
+		ferries = os.path.join(self.directory, 'ferry')
+		load_ferrydata(self.parser, 'ferry.csv', ferries)
+		ferrydata = load_ferrydata(self.parser, 'ferry.csv', ferries)
+		self.assertIsInstance(ferrydata.columns['arr'], np.memmap)
+		self.assertEqual(list(ferrydata), self.ferrydata)
+
+	def test_arrays(self):
+		"""Arrays are typed as for bulk parsing; times aren't copied."""
+		ferrydata = load_ferrydata(self.parser, 'ferry.csv',
+								   self.directory)
+		arrays = ferrydata.arrays()
+		bulk, __ = self.parser.bulk_ferrydata(
+				open(os.path.join(self.parser.path, 'ferry.csv')))
+		self.assertEqual(sorted(arrays), sorted(bulk))
+		for field in bulk:
+			self.assertEqual(arrays[field].tolist(),
+							 bulk[field].astype(arrays[field].dtype)
+							 .tolist())
+		self.assertEqual(arrays['dep'].dtype, np.dtype('datetime64[s]'))
+		self.assertTrue(np.may_share_memory(arrays['dep'],
+											ferrydata.columns['dep']))
+		self.assertIs(arrays['source'][0], self.ferrydata[0].source)
+
+	def test_segmap_from_columns(self):
+		"""A map built from cached columns matches one from records."""
+		expected = SegmentMap(self.cardata, self.ferrydata)
+		for __ in xrange(2): # compiled, then loaded
+			segmap = load_segmap(self.parser, 'car.csv', 'ferry.csv',
+								 self.directory)
+			self.assertEqual(segmap, expected)
+		self.assertTrue(os.path.exists(os.path.join(
+				self.directory, 'ferry.csv', 'manifest.json')))
+		cardata = load_cardata(Parser(LocationMap('Z', 'B'), tests=True),
+							   'car.csv',
+							   os.path.join(self.directory, 'car.csv'))
+		self.assertIsNone(cardata.arrays()['source'][0])
+
+	def test_invalidated(self):
+		"""A cache of another version of the source isn't loaded."""
+		source = os.path.join(self.parser.path, 'car.csv')
+		load_cardata(self.parser, 'car.csv', self.directory)
+		self.assertIsNotNone(CompiledData.load(self.directory, source))
+		stat = os.stat(source)
+		os.utime(source, (stat.st_atime, stat.st_mtime + 10))
+		try:
+			self.assertIsNone(CompiledData.load(self.directory, source))
+		finally:
+			os.utime(source, (stat.st_atime, stat.st_mtime))
+
+	def test_missing(self):
+		self.assertIsNone(CompiledData.load(self.directory))
+
+
+if __name__ == '__main__':
+	unittest.main()
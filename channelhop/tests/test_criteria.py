@@ -0,0 +1,57 @@
+import unittest
+from datetime import datetime, timedelta
+from channelhop.criteria import All, ArriveBy, MaxDrive, MaxCost
+from channelhop.criteria import from_name
+from channelhop.travel import Trip
+from channelhop.places import LocationMap
+from channelhop.exdata import Parser
+from channelhop.tests.test_exdata import FERRY_DATA, CAR_DATA
+
+
+class TestCriteria(unittest.TestCase):
+	def setUp(self):
+		dataset = {'car' : CAR_DATA, 'ferry' : FERRY_DATA}
+		lmap = LocationMap('A', 'B')
+		self.cardata, self.ferrydata = Parser(lmap).parse(dataset)
+		self.trip = self._trip()
+
+	def _trip(self, store='list'):
+		return Trip('A', 'B', self.ferrydata, self.cardata, store)
+
+	def test_composition(self):
+		"""Conjunctions are flattened into a single criterion."""
+		criterion = MaxCost(100) & MaxDrive(timedelta(hours=4))
+		criterion = criterion & ArriveBy([datetime(2000, 1, 2, 13)])
+		self.assertIsInstance(criterion, All)
+		self.assertEqual(len(criterion.criteria), 3)
+
+	def test_from_name(self):
+		criterion = from_name('cost', [100])
+		self.assertIsInstance(criterion, MaxCost)
+		self.assertEqual(criterion.limit, 110)
+
+	def test_unrecognised_name(self):
+		self.assertRaises(ValueError, from_name, 'colour', ['red'])
+
+	def test_combined_matches_sequential(self):
+		"""Several criteria in one call equal successive calls."""
+		sequential = self._trip()
+		sequential.constrain('cost', [100])
+		sequential.constrain('drive', [timedelta(hours=4)])
+		self.trip.constrain([MaxCost(100),
+							 MaxDrive(timedelta(hours=4))])
+		self.assertEqual(self.trip.options, sequential.options)
+		self.assertTrue(0 < self.trip.noptions() <
+						self.trip.total_options)
+
+	def test_lazy_store(self):
+		"""Criteria are applied to lazy views when iterated."""
+		trip = self._trip('lazy')
+		criterion = MaxCost(100) & MaxDrive(timedelta(hours=4))
+		trip.constrain(criterion)
+		self.trip.constrain(criterion)
+		self.assertItemsEqual(list(trip.options), self.trip.options)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+import os
 from datetime import datetime, timedelta
 import channelhop.exdata as exdata
 from channelhop.places import LocationMap
@@ -119,5 +120,153 @@ class TestParser(unittest.TestCase):
 		self.assertEqual(route.cost, 75)
 		self.assertEqual(route.note, '')
 
+
+class TestStreamingParser(unittest.TestCase):
+	def setUp(self):
+		self.lmap = LocationMap('A', 'B')
+		self.parser = exdata.Parser(self.lmap, tests=True)
+		raw_data = {'ferry' : FERRY_DATA, 'car' : CAR_DATA}
+		self.cardata, self.ferrydata = self.parser.parse(raw_data)
+
+	def test_read_files(self):
+		"""Records read from files match those parsed from lists."""
+		self.assertEqual(list(self.parser.read_cardata('car.csv')),
+						 self.cardata)
+		self.assertEqual(list(self.parser.read_ferrydata('ferry.csv')),
+						 self.ferrydata)
+
+	def test_lazy(self):
+		"""Records are yielded as lines are consumed."""
+		lines = iter(CAR_DATA)
+		records = self.parser.iter_cardata(lines)
+		next(records)
+		self.assertEqual(next(lines), CAR_DATA[1])
+
+	def test_quoted_note(self):
+		record = 'Le Havre,B,250,04:30,90,"tolls, A29 and A28"'
+		route = next(self.parser.iter_cardata([record]))
+		self.assertEqual(route.note, 'tolls, A29 and A28')
+		self.assertEqual(route.cost, 90)
+
+	def test_blank_lines(self):
+		records = list(self.parser.iter_ferrydata(['', FERRY_DATA[0]]))
+		self.assertEqual(len(records), 1)
+
+	def test_data_paths(self):
+		"""Data files are read from the package's data directory."""
+		package = os.path.dirname(exdata.__file__)
+		self.assertEqual(exdata.Parser(self.lmap).path,
+						 os.path.join(package, 'data'))
+		self.assertEqual(self.parser.path,
+						 os.path.join(package, 'tests', 'data'))
+
+
+class TestReadFiles(unittest.TestCase):
+	def setUp(self):
+		self.lmap = LocationMap('A', 'B')
+		self.parser = exdata.Parser(self.lmap, tests=True)
+		raw_data = {'ferry' : FERRY_DATA, 'car' : CAR_DATA}
+		self.cardata, self.ferrydata = self.parser.parse(raw_data)
+
+	def test_parallel(self):
+		"""Files are merged in order, whichever worker reads them."""
+		cd, fd = exdata.read_files(self.parser, ['car.csv'],
+								   ['ferry.csv', 'ferry.csv'],
+								   processes=2)
+		self.assertEqual(cd, self.cardata)
+		self.assertEqual(fd, self.ferrydata * 2)
+
+	def test_locations_consistent(self):
+		"""Locations from workers are the parser's own instances."""
+		cd, fd = exdata.read_files(self.parser, ['car.csv'],
+								   ['ferry.csv'], processes=2)
+		for record in cd + fd:
+			self.assertIs(record.source,
+						  self.parser.location[record.source.town])
+
+	def test_serial(self):
+		cd, fd = exdata.read_files(self.parser, ['car.csv'],
+								   ['ferry.csv'], processes=1)
+		self.assertEqual((cd, fd), (self.cardata, self.ferrydata))
+
+
+class TestPruning(unittest.TestCase):
+	def setUp(self):
+		self.lmap = LocationMap('A', 'B')
+		self.parser = exdata.Parser(self.lmap)
+		raw_data = {'ferry' : FERRY_DATA, 'car' : CAR_DATA}
+		self.cardata, self.ferrydata = self.parser.parse(raw_data)
+
+	def test_nothing_dominated(self):
+		"""Toll/no-toll variants and cabins trade off; all are kept."""
+		self.assertEqual(exdata.prune_cardata(self.cardata),
+						 (self.cardata, 0))
+		self.assertEqual(exdata.prune_ferrydata(self.ferrydata),
+						 (self.ferrydata, 0))
+
+	def test_dominated_sailing(self):
+		"""An earlier, dearer sailing arriving no sooner is dropped."""
+		first = self.ferrydata[0]
+		dominated = first._replace(dep=first.dep - timedelta(hours=1),
+								   cost=first.cost + 10)
+		later_day = dominated._replace(dep=dominated.dep +
+										   timedelta(days=1))
+		records = self.ferrydata + [dominated, later_day]
+		kept, pruned = exdata.prune_ferrydata(records)
+		self.assertEqual(pruned, 1)
+		self.assertEqual(kept, self.ferrydata + [later_day])
+
+	def test_dominated_variant(self):
+		route = self.cardata[4]
+		dominated = route._replace(duration=route.duration +
+										timedelta(minutes=1))
+		kept, pruned = exdata.prune_cardata(self.cardata + [dominated])
+		self.assertEqual((kept, pruned), (self.cardata, 1))
+
+	def test_duplicates_kept(self):
+		kept, pruned = exdata.prune_cardata(self.cardata * 2)
+		self.assertEqual(pruned, 0)
+
+
+@unittest.skipIf(exdata.np is None, "NumPy not available")
+class TestBulkParser(unittest.TestCase):
+	def setUp(self):
+		self.lmap = LocationMap('A', 'B')
+		self.parser = exdata.Parser(self.lmap)
+		self.raw_data = {'ferry' : FERRY_DATA, 'car' : CAR_DATA}
+
+	def test_matches_parse(self):
+		"""Bulk parsing gives the same records, in the same order."""
+		cardata, ferrydata = self.parser.parse(self.raw_data)
+		cd, fd, errors = self.parser.parse_bulk(self.raw_data)
+		self.assertEqual(list(cd), cardata)
+		self.assertEqual(list(fd), ferrydata)
+		self.assertEqual(errors, {'car' : [], 'ferry' : []})
+
+	def test_column_types(self):
+		columns, _ = self.parser.bulk_ferrydata(FERRY_DATA)
+		self.assertEqual(columns['dep'].dtype.kind, 'M')
+		self.assertEqual(len(columns['dep']), 9)
+		columns, _ = self.parser.bulk_cardata(CAR_DATA)
+		self.assertEqual(columns['duration'].dtype.kind, 'm')
+
+	def test_malformed_rows(self):
+		"""All malformed rows are reported and skipped."""
+		lines = list(FERRY_DATA)
+		lines[1] = lines[1].replace('2000-01-01', '2000-13-01')
+		lines[3] = lines[3].replace('160', 'abc')
+		lines[5] = 'Cherbourg,Poole'
+		columns, errors = self.parser.bulk_ferrydata(lines)
+		self.assertEqual([number for number, _ in errors], [2, 4, 6])
+		self.assertIn('abc', errors[1][1])
+		self.assertEqual(len(columns['dep']), 5)
+
+	def test_malformed_duration(self):
+		lines = list(CAR_DATA)
+		lines[2] = lines[2].replace('04:30', '4h30')
+		columns, errors = self.parser.bulk_cardata(lines)
+		self.assertEqual(errors, [(3, "bad duration: '4h30'")])
+		self.assertEqual(len(columns['duration']), 8)
+
 if __name__ == '__main__':
 	unittest.main()
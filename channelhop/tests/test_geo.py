@@ -0,0 +1,54 @@
+import unittest
+import random
+from channelhop.geo import SpatialIndex, distance
+
+
+class TestDistance(unittest.TestCase):
+	def test_distance(self):
+		"""Portsmouth to Le Havre is roughly 170km."""
+		self.assertAlmostEqual(distance((50.80, -1.09), (49.49, 0.11)),
+							   170, delta=5)
+
+	def test_symmetric(self):
+		a, b = (51.5, -0.1), (43.3, -3.0)
+		self.assertEqual(distance(a, b), distance(b, a))
+		self.assertEqual(distance(a, a), 0)
+
+
+class TestSpatialIndex(unittest.TestCase):
+	def setUp(self):
+		rand = random.Random(0)
+		self.points = [(rand.uniform(35, 70), rand.uniform(-20, 30))
+					   for _ in xrange(200)]
+		self.index = SpatialIndex((p, i) for i, p in
+								  enumerate(self.points))
+		self.target = (50.0, 0.0)
+
+	def _by_distance(self):
+		return sorted(xrange(len(self.points)),
+					  key=lambda i: distance(self.points[i],
+											 self.target))
+
+	def test_nearest(self):
+		"""Nearest items match a brute-force ordering."""
+		self.assertEqual(self.index.nearest(self.target, 5),
+						 self._by_distance()[:5])
+
+	def test_nearest_all(self):
+		self.assertEqual(len(self.index.nearest(self.target, 500)), 200)
+		self.assertEqual(self.index.nearest(self.target, 0), [])
+
+	def test_within(self):
+		expected = [i for i in self._by_distance()
+					if distance(self.points[i], self.target) <= 500]
+		self.assertItemsEqual(self.index.within(self.target, 500),
+							  expected)
+
+	def test_empty(self):
+		index = SpatialIndex([])
+		self.assertEqual(index.nearest(self.target), [])
+		self.assertEqual(index.within(self.target, 100), [])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,42 @@
+import random
+import unittest
+from channelhop.pareto import frontier
+
+
+def dominates(a, b):
+	return all(x <= y for x, y in zip(a, b)) and a != b
+
+
+def brute_force(points):
+	return [p for p in points
+			if not any(dominates(q, p) for q in points)]
+
+
+class TestFrontier(unittest.TestCase):
+	def setUp(self):
+		self.random = random.Random(0)
+
+	def _points(self, n, dims):
+		# Small value range so ties and duplicates occur.
+		return [tuple(self.random.randint(0, 20) for __ in range(dims))
+				for __ in range(n)]
+
+	def test_against_brute_force(self):
+		"""Frontier matches pairwise comparison for 1-4 criteria."""
+		for dims in (1, 2, 3, 4):
+			points = self._points(500, dims)
+			result = frontier(points, key=lambda p: p)
+			self.assertItemsEqual(result, brute_force(points))
+
+	def test_duplicates_kept(self):
+		"""Items with identical keys don't dominate each other."""
+		items = [('a', (1, 2)), ('b', (1, 2)), ('c', (2, 2))]
+		result = frontier(items, key=lambda item: item[1])
+		self.assertEqual([item[0] for item in result], ['a', 'b'])
+
+	def test_empty(self):
+		self.assertEqual(frontier([], key=lambda p: p), [])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -1,5 +1,11 @@
 from channelhop.places import Location, LocationMap, FERRY_ROUTES
+from channelhop.places import find_paths, has_single_crossing
+from channelhop.places import PortNetwork, time_difference, DEFAULT_NETWORK
+from datetime import timedelta
 import unittest
+import copy
+import pickle
+import cPickle
 
 sample_locations = {} 
 
@@ -11,6 +17,32 @@ class TestLocation(unittest.TestCase):
 		self.assertEqual(Location('B', 'FR'), ('B', 'FR'))
 
 
+	def test_interned(self):
+		"""Equal locations are the same instance."""
+		town = ''.join(['Ports', 'mouth'])
+		self.assertIs(Location(town, 'UK'), Location('Portsmouth', 'UK'))
+		self.assertIs(Location(town, 'UK').town, 'Portsmouth')
+		self.assertIsNot(Location('A', 'UK'), Location('A', 'FR'))
+
+	def test_interned_copies(self):
+		"""Pickled, copied and replaced locations are interned."""
+		location = Location('A', 'UK')
+		for protocol in xrange(pickle.HIGHEST_PROTOCOL + 1):
+			for module in (pickle, cPickle):
+				self.assertIs(module.loads(module.dumps(location,
+														protocol)),
+							  location)
+		self.assertIs(copy.copy(location), location)
+		self.assertIs(copy.deepcopy(location), location)
+		self.assertIs(Location('B', 'UK')._replace(town='A'), location)
+
+	def test_tuple_equality(self):
+		location = Location('A', 'UK')
+		self.assertEqual(location, ('A', 'UK'))
+		self.assertEqual(hash(location), hash(('A', 'UK')))
+		self.assertIn(('A', 'UK'), set([location]))
+
+
 class TestLocationMap(unittest.TestCase):
 	def setUp(self):
 		self.orig = 'A'
@@ -37,6 +69,159 @@ class TestLocationMap(unittest.TestCase):
 		self.assertItemsEqual(self.lmap.paths['RTN'],
 							  self.expected_returns)
 
+	def test_crossings_pruned(self):
+		"""Unrestricted search finds multi-crossing paths too."""
+		paths = find_paths(self.lmap, self.orig, self.dest)
+		self.assertGreater(len(paths), 6)
+		pruned = filter(has_single_crossing, paths)
+		self.assertItemsEqual(pruned, self.lmap.paths['OUT'])
+
+	def test_invalid_start(self):
+		self.assertRaises(ValueError, find_paths, self.lmap,
+						  Location('C', 'UK'), self.dest)
+
+
+class TestPortNetwork(unittest.TestCase):
+	def setUp(self):
+		self.network = PortNetwork(FERRY_ROUTES)
+
+	def test_ports_by_country(self):
+		self.assertEqual(len(self.network.ports_by_country['UK']), 3)
+		self.assertEqual(len(self.network.ports_by_country['FR']), 5)
+
+	def test_routes_by_port(self):
+		"""Routes are indexed in both directions."""
+		routes = self.network.routes_by_port
+		self.assertEqual(len(routes[Location('Portsmouth', 'UK')]), 4)
+		self.assertEqual(routes[Location('Cherbourg', 'FR')],
+						 set([Location('Portsmouth', 'UK'),
+							  Location('Poole', 'UK')]))
+
+	def test_time_difference(self):
+		self.assertEqual(time_difference('UK', 'ES'), timedelta(hours=1))
+		self.assertEqual(time_difference('NL', 'IE'),
+						 timedelta(hours=-1))
+		self.assertEqual(time_difference('FR', 'ES'), timedelta(0))
+
+
+class TestMultiCountryLocationMap(unittest.TestCase):
+	def setUp(self):
+		self.plymouth = Location('Plymouth', 'UK')
+		self.santander = Location('Santander', 'ES')
+		self.rosslare = Location('Rosslare', 'IE')
+		self.cherbourg = Location('Cherbourg', 'FR')
+		routes = FERRY_ROUTES + [
+				(self.plymouth, self.santander),
+				(Location('Portsmouth', 'UK'), Location('Bilbao', 'ES')),
+				(Location('Pembroke', 'UK'), self.rosslare),
+				(self.rosslare, self.cherbourg)
+				]
+		self.network = PortNetwork(routes)
+
+	def test_country_pair(self):
+		lmap = LocationMap('A', 'Madrid', 'UK', 'ES',
+						   network=self.network)
+		self.assertEqual(lmap.destination, Location('Madrid', 'ES'))
+		self.assertEqual(len(lmap.paths['OUT']), 2)
+		self.assertIn([lmap.origin, self.plymouth, self.santander,
+					   lmap.destination], lmap.paths['OUT'])
+
+	def test_location_endpoints(self):
+		origin = Location('Cork', 'IE')
+		lmap = LocationMap(origin, 'B', network=self.network)
+		self.assertEqual(lmap.origin, origin)
+		self.assertEqual(lmap.paths['OUT'],
+						 [[origin, self.rosslare, self.cherbourg,
+						   lmap.destination]])
+
+	def test_splice_matches_search(self):
+		"""Spliced skeleton paths equal a full search of the map."""
+		for countries in (('UK', 'FR'), ('UK', 'ES'), ('IE', 'FR')):
+			for max_crossings in (1, 2, 3):
+				lmap = LocationMap('A', 'B', *countries,
+								   network=self.network,
+								   max_crossings=max_crossings)
+				a, b = lmap.origin, lmap.destination
+				self.assertItemsEqual(
+						lmap.paths['OUT'],
+						find_paths(lmap, a, b, max_crossings))
+				self.assertItemsEqual(
+						lmap.paths['RTN'],
+						find_paths(lmap, b, a, max_crossings))
+
+	def test_skeleton_cached(self):
+		"""Maps on the same network share its port paths."""
+		LocationMap('A', 'B', network=self.network)
+		skeleton = self.network.skeleton('UK', 'FR')
+		LocationMap('C', 'D', network=self.network)
+		self.assertIs(self.network.skeleton('UK', 'FR'), skeleton)
+
+	def test_max_crossings(self):
+		"""Paths via third countries need more crossings."""
+		lmap = LocationMap('A', 'B', network=self.network)
+		self.assertEqual(len(lmap.paths['OUT']), 6)
+		lmap = LocationMap('A', 'B', network=self.network,
+						   max_crossings=2)
+		self.assertIn([lmap.origin, Location('Pembroke', 'UK'),
+					   self.rosslare, self.cherbourg, lmap.destination],
+					  lmap.paths['OUT'])
+
+
+class TestGeographicFiltering(unittest.TestCase):
+	def setUp(self):
+		self.origin = Location('Brighton', 'UK')
+		self.destination = Location('Rouen', 'FR')
+		self.coordinates = {self.origin : (50.82, -0.14),
+							self.destination : (49.44, 1.10)}
+
+	def _lmap(self, **kwargs):
+		return LocationMap(self.origin, self.destination,
+						   coordinates=self.coordinates, **kwargs)
+
+	def test_coordinates_local(self):
+		"""Coordinates belong to the map, not the location."""
+		lmap = self._lmap()
+		self.assertEqual(lmap.coordinates[self.origin], (50.82, -0.14))
+		self.assertEqual(lmap.coordinates[Location('Dieppe', 'FR')],
+						 (49.93, 1.08))
+		self.assertNotIn(self.origin, LocationMap('Brighton', 'Rouen')
+							.coordinates)
+		self.assertNotIn(self.origin, DEFAULT_NETWORK.coordinates)
+
+	def test_unfiltered(self):
+		lmap = self._lmap()
+		self.assertEqual(len(lmap.paths['OUT']), 6)
+
+	def test_nearest(self):
+		lmap = self._lmap(nearest=1)
+		self.assertEqual(lmap.candidates[self.origin],
+						 set([Location('Newhaven', 'UK')]))
+		self.assertEqual(lmap.paths['OUT'],
+						 [[self.origin, Location('Newhaven', 'UK'),
+						   Location('Dieppe', 'FR'), self.destination]])
+
+	def test_detour(self):
+		"""Ports far off the direct line are excluded."""
+		lmap = self._lmap(detour=1.5)
+		ports = lmap.candidates[self.destination]
+		self.assertIn(Location('Le Havre', 'FR'), ports)
+		self.assertNotIn(Location('St. Malo', 'FR'), ports)
+		for path in lmap.paths['OUT'] + lmap.paths['RTN']:
+			self.assertNotIn(Location('St. Malo', 'FR'), path)
+
+	def test_unlocated_endpoint(self):
+		"""Filtering needs coordinates; other endpoints are unaffected."""
+		lmap = LocationMap(self.origin, self.destination, nearest=1)
+		self.assertEqual(len(lmap.paths['OUT']), 6)
+
+	def test_unlocated_ports(self):
+		"""Ports the network hasn't located are never excluded."""
+		network = PortNetwork(FERRY_ROUTES)
+		lmap = LocationMap(self.origin, self.destination,
+						   network=network, nearest=1,
+						   coordinates=self.coordinates)
+		self.assertEqual(len(lmap.paths['OUT']), 6)
+
 
 if __name__ == '__main__':
 	unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+from datetime import datetime, timedelta
+from channelhop.timetable import Timetable, ProfileEntry
+from channelhop.travel import SegmentMap, Itinerary, Route, EPOCH
+from channelhop.places import Location, LocationMap
+from channelhop.exdata import Parser, CarData, FerryData
+from channelhop.pareto import frontier
+from channelhop.tests.test_exdata import FERRY_DATA, CAR_DATA
+
+
+class TestTimetable(unittest.TestCase):
+	def setUp(self):
+		dataset = {'car' : CAR_DATA, 'ferry' : FERRY_DATA}
+		self.lmap = lmap = LocationMap('A', 'B')
+		cardata, ferrydata = Parser(lmap).parse(dataset)
+		self.segmap = SegmentMap(cardata, ferrydata)
+		self.timetable = Timetable(self.segmap)
+		self.origin, self.destination = lmap.origin, lmap.destination
+
+	def _brute_force(self, departure):
+		# Earliest arrival over all outward itineraries.
+		arrivals = [itinerary.arrival
+					for path in self.lmap.paths['OUT']
+					for itinerary in Route(path, self.segmap)
+					if itinerary[0].datetime >= departure]
+		return min(arrivals) if arrivals else None
+
+	def test_sorted(self):
+		"""Every sailing (including cabin variants) is a connection."""
+		self.assertEqual(len(self.timetable), 9)
+		self.assertEqual(self.timetable.departures,
+						 sorted(self.timetable.departures))
+
+	def test_matches_itineraries(self):
+		"""Earliest arrivals agree with generated itineraries."""
+		for hours in xrange(0, 72, 3):
+			departure = datetime(2000, 1, 1) + timedelta(hours=hours)
+			self.assertEqual(
+					self.timetable.earliest_arrival(
+							self.origin, self.destination, departure),
+					self._brute_force(departure))
+
+	def test_earliest_arrival(self):
+		arrival = self.timetable.earliest_arrival(
+				self.origin, self.destination, datetime(2000, 1, 1, 20))
+		self.assertEqual(arrival, datetime(2000, 1, 2, 12, 30))
+
+	def test_unreachable(self):
+		self.assertIsNone(self.timetable.earliest_arrival(
+				self.origin, self.destination, datetime(2000, 1, 3)))
+
+	def test_connection_time(self):
+		"""Check-in time rules out the 2300 sailing."""
+		timetable = Timetable(self.segmap, timedelta(hours=1))
+		arrival = timetable.earliest_arrival(
+				self.origin, self.destination, datetime(2000, 1, 1, 22))
+		self.assertEqual(arrival, datetime(2000, 1, 2, 16, 45))
+
+	def test_journey(self):
+		segments = self.timetable.journey(
+				self.origin, self.destination, datetime(2000, 1, 1, 20))
+		self.assertEqual(len(segments), 3)
+		itinerary = Itinerary(segments)
+		self.assertEqual(itinerary[0].location, self.origin)
+		self.assertEqual(itinerary.arrival, datetime(2000, 1, 2, 12, 30))
+
+	def test_profile_matches_itineraries(self):
+		"""The profile is the frontier of all outward itineraries."""
+		start, end = datetime(2000, 1, 1), datetime(2000, 1, 3)
+		for connection in (timedelta(0), timedelta(hours=3)):
+			triples = [(itinerary[0].datetime, itinerary.arrival,
+						itinerary.cost)
+					   for path in self.lmap.paths['OUT']
+					   for itinerary in Route(path, self.segmap,
+											  connection)]
+			expected = frontier(
+					[t for t in triples if start <= t[0] <= end],
+					key=lambda t: (EPOCH - t[0], t[1], t[2]))
+			timetable = Timetable(self.segmap, connection)
+			profile = timetable.profile(self.origin, self.destination,
+										start, end)
+			self.assertEqual(profile, sorted(set(expected)))
+			self.assertIsInstance(profile[0], ProfileEntry)
+
+	def test_profile_window(self):
+		"""Both Le Havre drives trade arrival against cost."""
+		profile = self.timetable.profile(
+				self.origin, self.destination,
+				datetime(2000, 1, 2, 7), datetime(2000, 1, 3))
+		departures = [entry.departure for entry in profile]
+		self.assertEqual(departures, [datetime(2000, 1, 2, 7),
+									  datetime(2000, 1, 2, 8, 45),
+									  datetime(2000, 1, 2, 22, 15),
+									  datetime(2000, 1, 2, 22, 15)])
+
+	def test_profile_window_end(self):
+		"""Journeys leaving after the window don't hide earlier ones.
+
+		The 2200 sailing is quicker and cheaper than the 2000, but
+		can only be reached by leaving after the window.
+
+		"""
+		a, p, q, b = path = [Location('A', 'UK'), Location('P', 'UK'),
+							 Location('Q', 'FR'), Location('B', 'FR')]
+		cars = [CarData(a, p, 50, timedelta(hours=1), 10, ''),
+				CarData(q, b, 50, timedelta(hours=1), 10, '')]
+		ferries = [
+				FerryData(p, q, 'Op', datetime(2000, 1, 1, 20),
+						  datetime(2000, 1, 2, 9), 100, ''),
+				FerryData(p, q, 'Op', datetime(2000, 1, 1, 22),
+						  datetime(2000, 1, 2, 7), 50, '')]
+		segmap = SegmentMap(cars, ferries)
+		start, end = datetime(2000, 1, 1), datetime(2000, 1, 1, 19, 30)
+		connection = timedelta(hours=1)
+		profile = Timetable(segmap, connection).profile(a, b, start,
+														end)
+		expected = [(itinerary[0].datetime, itinerary.arrival,
+					 itinerary.cost)
+					for itinerary in Route(path, segmap, connection)
+					if start <= itinerary[0].datetime <= end]
+		self.assertEqual(profile, expected)
+		self.assertEqual(profile,
+						 [(datetime(2000, 1, 1, 18),
+						   datetime(2000, 1, 2, 10), 120)])
+
+	def test_profile_arrivals_earliest(self):
+		"""Each entry arrives no sooner than the earliest arrival."""
+		for entry in self.timetable.profile(
+				self.origin, self.destination,
+				datetime(2000, 1, 1), datetime(2000, 1, 3)):
+			self.assertLessEqual(
+					self.timetable.earliest_arrival(
+							self.origin, self.destination,
+							entry.departure),
+					entry.arrival)
+
+
+if __name__ == '__main__':
+	unittest.main()
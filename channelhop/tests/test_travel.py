@@ -1,15 +1,23 @@
+# coding: utf-8
 import unittest
 from channelhop.travel import Waypoint, Link, Segment, SegmentMap
-from channelhop.travel import Itinerary, Route, Trip
+from channelhop.travel import FrozenWaypoint, FrozenLink, FrozenSegment
+from channelhop.travel import Itinerary, Route, Trip, ItineraryStore
+from channelhop.travel import OptionView, OptionTable, PathExpander
+from channelhop.criteria import Criterion
 from channelhop.places import Location, LocationMap
 from channelhop.exdata import FerryData
 from channelhop.exdata import CarData
 from channelhop.exdata import Parser
 from channelhop.tests.test_exdata import FERRY_DATA
 from channelhop.tests.test_exdata import CAR_DATA
-from channelhop.timing import DateTime, Duration
 from datetime import timedelta, datetime
 
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
 class TestWaypoint(unittest.TestCase):
 	def setUp(self):
 		location = Location('A', 'Country')
@@ -28,27 +36,29 @@ class TestWaypoint(unittest.TestCase):
 		"""
 		new_wp = Waypoint(self.wp.location, None)
 		old_wp = self.wp
-		old_wp.merge(new_wp)
-		self.assertEqual(old_wp, self.wp)
+		merged = old_wp.merge(new_wp)
+		self.assertEqual(merged, self.wp)
 
 	def test_merge_with_datetime(self):
 		"""Test merge with a waypoint possessing a datetime.
 		
-		Waypoint is updated with the new datetime.
+		Merged waypoint has the new datetime; the original waypoint
+		is not modified.
 		
 		"""
 		old_wp = Waypoint(self.wp.location, None)
 		new_wp = self.wp
-		old_wp.merge(new_wp)
-		self.assertEqual(old_wp, self.wp)
+		merged = old_wp.merge(new_wp)
+		self.assertEqual(merged, self.wp)
+		self.assertIsNone(old_wp.datetime)
 
 	def test_merge_nodatetimes(self):
 		"""Test merge between two waypoints with no datetimes"""
 		old_wp = Waypoint(self.wp.location, None)
 		new_wp = Waypoint(self.wp.location, None)
-		copy = old_wp
-		old_wp.merge(new_wp)
-		self.assertEqual(old_wp, copy)
+		merged = old_wp.merge(new_wp)
+		self.assertEqual(merged, old_wp)
+		self.assertIsNone(merged.datetime)
 
 	def test_merge_mismatched_location(self):
 		"""Test merge between two waypoints with different locations.
@@ -158,8 +168,63 @@ class TestSegment(unittest.TestCase):
 						   'Ferry Operator, test note'
 						   )
 		self.assertEqual(str(seg), expected_string)
+
+	def test_from_FerryData_other_countries(self):
+		"""Time differences apply to any pair of countries."""
+		record = FerryData(Location('A', 'ES'),
+						   Location('B', 'IE'),
+						   'Ferry Operator',
+						   datetime(2000, 1, 1, 20, 00),
+						   datetime(2000, 1, 2, 12, 00),
+						   300,
+						   '')
+		seg = Segment.from_FerryData(record)
+		self.assertEqual(seg.link.duration, timedelta(hours=17))
 			 
 
+class TestFrozenSegment(unittest.TestCase):
+	"""Tests the slotted, hashable segment variants."""
+	def setUp(self):
+		self.start = FrozenWaypoint(Location('A', 'UK'),
+									datetime(2000, 1, 1, 9, 30))
+		self.end = FrozenWaypoint(Location('B', 'UK'),
+								  datetime(2000, 1, 1, 10, 15))
+		self.link = FrozenLink(timedelta(minutes=45), 5.50)
+		self.seg = FrozenSegment(self.start, self.end, self.link)
+
+	def test_slotted(self):
+		for obj in (self.start, self.link, self.seg):
+			self.assertEqual(type(obj).__slots__, ())
+			self.assertRaises(AttributeError, setattr, obj, 'x', 1)
+
+	def test_hashable(self):
+		"""Equal segments hash equally and de-duplicate in sets."""
+		copy = FrozenSegment(FrozenWaypoint(*self.start),
+							 FrozenWaypoint(*self.end),
+							 FrozenLink(*self.link))
+		self.assertEqual(len(set([self.seg, copy])), 1)
+		self.assertEqual({self.seg : 1}[copy], 1)
+
+	def test_equal_to_mutable(self):
+		"""Frozen and mutable variants compare field-wise."""
+		seg = Segment(Waypoint(*self.start), Waypoint(*self.end),
+					  Link(*self.link))
+		self.assertEqual(self.seg, seg)
+		self.assertEqual(seg, self.seg)
+		self.assertFalse(seg != self.seg)
+
+	def test_str(self):
+		self.assertEqual(str(self.seg),
+						 'A, UK (Sat 01 Jan, 0930) --> '
+						 'B, UK (Sat 01 Jan, 1015) : '
+						 '0h45 \xc2\xa35.50')
+
+	def test_over_constrained(self):
+		link = FrozenLink(timedelta(minutes=50), 5.65)
+		self.assertRaises(ValueError, FrozenSegment, self.start,
+						  self.end, link)
+
+
 class TestSegmentMap(unittest.TestCase):
 	"""Test Case for the SegmentMap class.
 
@@ -174,6 +239,49 @@ class TestSegmentMap(unittest.TestCase):
 		cardata, ferrydata = Parser(lmap).parse(dataset)
 		self.segmap = SegmentMap(cardata, ferrydata)
 
+	def test_frozen_segments(self):
+		"""Segments in the map are frozen."""
+		for segments in self.segmap.values():
+			for segment in segments:
+				self.assertIsInstance(segment, FrozenSegment)
+
+	def test_streamed_records(self):
+		"""Records streamed from disk give the same map."""
+		parser = Parser(LocationMap('A', 'B'), tests=True)
+		segmap = SegmentMap(parser.read_cardata('car.csv'),
+							parser.read_ferrydata('ferry.csv'))
+		self.assertEqual(segmap, self.segmap)
+
+	def test_from_files(self):
+		parser = Parser(LocationMap('A', 'B'), tests=True)
+		segmap = SegmentMap.from_files(parser, ['car.csv'],
+									   ['ferry.csv'], processes=2)
+		self.assertEqual(segmap, self.segmap)
+
+	@unittest.skipIf(numpy is None, "numpy not available")
+	def test_from_columns(self):
+		"""Columns parsed in bulk give the same map."""
+		parser = Parser(LocationMap('A', 'B'))
+		car_columns, __ = parser.bulk_cardata(CAR_DATA)
+		ferry_columns, __ = parser.bulk_ferrydata(FERRY_DATA)
+		segmap = SegmentMap.from_columns(car_columns, ferry_columns)
+		self.assertEqual(segmap, self.segmap)
+		for key, segments in segmap.items():
+			for segment, expected in zip(segments, self.segmap[key]):
+				self.assertIsInstance(segment, FrozenSegment)
+				self.assertEqual(str(segment), str(expected))
+				self.assertIs(type(segment.link.cost), float)
+
+	def test_prune(self):
+		"""Pruned counts are reported; dominated segments dropped."""
+		dataset = {'car' : CAR_DATA, 'ferry' : FERRY_DATA}
+		cardata, ferrydata = Parser(LocationMap('A', 'B')).parse(dataset)
+		dominated = cardata[0]._replace(cost=cardata[0].cost + 1)
+		segmap = SegmentMap(cardata + [dominated], ferrydata, prune=True)
+		self.assertEqual(segmap.pruned, {'car' : 1, 'ferry' : 0})
+		self.assertEqual(segmap, self.segmap)
+		self.assertEqual(self.segmap.pruned, {'car' : 0, 'ferry' : 0})
+
 	def test_non_constrained_single_route(self):
 		"""Tests for a simple bi-directional road route (no sched.)"""
 		key = Location('A', 'UK'), Location('Portsmouth', 'UK')
@@ -276,6 +384,7 @@ class TestItinerary(unittest.TestCase):
 				Segment(*fer_wps, link=ferry),
 				Segment(*car_wps[2:], link=car[1]),
 				]
+		self.segments = segments
 		self.itin = Itinerary(segments)
 
 	def test_cost(self):
@@ -292,6 +401,28 @@ class TestItinerary(unittest.TestCase):
 		self.assertEqual(self.itin[0].datetime,
 						 datetime(2000, 1, 1, 8, 15))
 
+	def test_durations(self):
+		"""Total and driving durations exclude/include the ferry."""
+		self.assertEqual(self.itin.duration, timedelta(minutes=315))
+		self.assertEqual(self.itin.drive, timedelta(minutes=135))
+
+	def test_invalidation(self):
+		"""Aggregates are recomputed after modification."""
+		self.itin.append(Link(timedelta(minutes=30), 7.5, ''))
+		self.itin.append(Waypoint(Location('C', 'FR'),
+								  datetime(2000, 1, 1, 15, 0)))
+		self.assertEqual(self.itin.cost, 122.5)
+		self.assertEqual(self.itin.drive, timedelta(minutes=165))
+		self.assertEqual(self.itin.arrival, datetime(2000, 1, 1, 15))
+		del self.itin[-2:]
+		self.assertEqual(self.itin.cost, 115.0)
+
+	def test_segments_unmodified(self):
+		"""Building an itinerary doesn't modify shared segments."""
+		self.assertIsNone(self.segments[0].start.datetime)
+		self.assertIsNone(self.segments[2].end.datetime)
+		self.assertIs(self.itin[1], self.segments[0].link)
+
 
 class TestRoute(unittest.TestCase):
 	def setUp(self):
@@ -333,6 +464,126 @@ class TestRoute(unittest.TestCase):
 		self.assertEqual(self.route.cost, (154, 315))
 
 
+class TestRouteConnections(unittest.TestCase):
+	"""Tests pruning of infeasible connections between sailings."""
+	def setUp(self):
+		self.path = [Location('X', 'UK'), Location('Y', 'FR'),
+					 Location('Z', 'FR'), Location('W', 'UK')]
+		x, y, z, w = self.path
+		ferries = [
+				FerryData(x, y, 'Op', datetime(2000, 1, 1, 8, 0),
+						  datetime(2000, 1, 1, 12, 0), 50, ''),
+				FerryData(z, w, 'Op', datetime(2000, 1, 1, 12, 30),
+						  datetime(2000, 1, 1, 14, 30), 50, ''),
+				FerryData(z, w, 'Op', datetime(2000, 1, 1, 14, 0),
+						  datetime(2000, 1, 1, 16, 0), 50, ''),
+				]
+		cars = [CarData(y, z, 50, timedelta(hours=1), 10, '')]
+		self.segmap = SegmentMap(cars, ferries)
+		dataset = {'car' : CAR_DATA, 'ferry' : FERRY_DATA}
+		lmap = LocationMap('A', 'B')
+		self.cardata, self.ferrydata = Parser(lmap).parse(dataset)
+
+	def test_unreachable_sailing_pruned(self):
+		"""The 1230 sailing can't be reached after a 1h drive."""
+		route = Route(self.path, self.segmap)
+		self.assertEqual(len(route), 1)
+		self.assertEqual(route[0][-3].datetime,
+						 datetime(2000, 1, 1, 14, 0))
+
+	def test_connection_time(self):
+		"""A longer check-in time prunes the remaining sailing."""
+		route = Route(self.path, self.segmap,
+					  connection=timedelta(minutes=45))
+		self.assertEqual(len(route), 1)
+		route = Route(self.path, self.segmap,
+					  connection=timedelta(hours=2))
+		self.assertEqual(len(route), 0)
+
+	def test_check_in(self):
+		"""Car legs reach the port the connection time early."""
+		trip = Trip('A', 'B', self.ferrydata, self.cardata,
+					connection=timedelta(hours=3))
+		plain = Trip('A', 'B', self.ferrydata, self.cardata)
+		for itinerary, expected in zip(trip.out, plain.out):
+			self.assertEqual(itinerary[2], expected[2]) # port
+			self.assertEqual(itinerary[0].datetime,
+							 expected[0].datetime - timedelta(hours=3))
+			self.assertEqual(itinerary.arrival, expected.arrival)
+
+
+class TestPathExpander(unittest.TestCase):
+	"""Tests memoised expansion of paths shared between routes."""
+	def setUp(self):
+		dataset = {'car' : CAR_DATA, 'ferry' : FERRY_DATA}
+		self.lmap = lmap = LocationMap('A', 'B')
+		cardata, ferrydata = Parser(lmap).parse(dataset)
+		self.segmap = SegmentMap(cardata, ferrydata)
+		self.expander = PathExpander(self.segmap)
+
+	def test_matches_unshared(self):
+		"""Shared expansion gives the same itineraries per route."""
+		for path in self.lmap.paths['OUT'] + self.lmap.paths['RTN']:
+			shared = Route(path, self.segmap, expander=self.expander)
+			alone = Route(path, self.segmap)
+			self.assertEqual(shared, alone)
+
+	def test_suffix_shared(self):
+		"""Post-ferry drives are expanded once, whatever the sailing."""
+		for path in self.lmap.paths['OUT']:
+			self.expander.expand(path)
+		for path in self.lmap.paths['OUT']:
+			if not self.expander.expand(path):
+				continue # no sailings
+			suffix = tuple(path[-2:])
+			keys = [key for key in self.expander._memo
+					if key[0] == suffix]
+			self.assertEqual(keys, [(suffix, None)])
+
+	def test_clear(self):
+		self.expander.expand(self.lmap.paths['OUT'][0])
+		self.expander.clear()
+		self.assertEqual(self.expander._memo, {})
+
+
+class TestItineraryStore(unittest.TestCase):
+	"""Tests the array-backed itinerary store."""
+	def setUp(self):
+		dataset = {'car' : CAR_DATA, 'ferry' : FERRY_DATA}
+		self.lmap = lmap = LocationMap('A', 'B')
+		cardata, ferrydata = Parser(lmap).parse(dataset)
+		self.segmap = SegmentMap(cardata, ferrydata)
+		self.store = ItineraryStore.from_paths(lmap.paths['OUT'],
+											   self.segmap)
+		self.itineraries = [itinerary
+							for path in lmap.paths['OUT']
+							for itinerary in Route(path, self.segmap)]
+
+	def test_rows(self):
+		"""There is a row per itinerary, sharing the segment table."""
+		self.assertEqual(len(self.store), len(self.itineraries))
+		self.assertEqual(len(self.store.row(0)), 3)
+		self.assertLess(len(self.segmap.table),
+						len(self.store.segments))
+
+	def test_materialise(self):
+		"""Rows materialise into the equivalent Itinerary."""
+		self.assertEqual(list(self.store), self.itineraries)
+		self.assertEqual(self.store[-1].pprint(),
+						 self.itineraries[-1].pprint())
+
+	def test_derived_arrays(self):
+		"""Cost and schedule arrays match the itineraries."""
+		epoch = datetime(1970, 1, 1)
+		for i, itinerary in enumerate(self.itineraries):
+			self.assertEqual(self.store.cost[i], itinerary.cost)
+			arrival = epoch + timedelta(seconds=self.store.arrival[i])
+			self.assertEqual(arrival, itinerary.arrival)
+			departure = epoch + timedelta(
+					seconds=self.store.departure[i])
+			self.assertEqual(departure, itinerary[0].datetime)
+
+
 class TestTrip(unittest.TestCase):
 	"""Tests the high-level Trip class."""
 	def setUp(self):
@@ -347,6 +598,246 @@ class TestTrip(unittest.TestCase):
 		"""Dummy test. Trip is instantiating smoothly if no error"""
 		pass
 
+	def test_top_k(self):
+		"""The k cheapest options match the head of the sorted list."""
+		top = self.trip.top_k(5)
+		self.assertEqual(len(top), 5)
+		self.assertEqual([o.cost for o in top],
+						 [o.cost for o in self.trip.options[:5]])
+
+	def test_top_k_constrained(self):
+		"""Constrained options are skipped by top_k."""
+		self.trip.constrain('drive', [timedelta(hours=4)])
+		top = self.trip.top_k(len(self.trip.options) + 1)
+		self.assertItemsEqual(top, self.trip.options)
+
+	def test_top_k_unsupported_key(self):
+		self.assertRaises(ValueError, self.trip.top_k, 5, 'arrival')
+
+	def test_pareto(self):
+		"""Frontier options are exactly the non-dominated options."""
+		key = lambda o: (o.cost, o.arrival_time, o.out[-2].duration)
+		points = [key(o) for o in self.trip.options]
+		def dominated(p):
+			return any(all(x <= y for x, y in zip(q, p)) and q != p
+					   for q in points)
+		expected = [o for o in self.trip.options
+					if not dominated(key(o))]
+		self.assertItemsEqual(self.trip.pareto(), expected)
+		self.assertTrue(0 < len(expected) < self.trip.total_options)
+
+	def test_pareto_unsupported(self):
+		self.assertRaises(ValueError, self.trip.pareto, ['colour'])
+
+	def test_constraints_are_named(self):
+		"""Re-using a constraint name replaces it, relaxing allowed."""
+		self.trip.constrain('cost', [70])
+		tight = self.trip.noptions()
+		self.trip.constrain('cost', [100])
+		self.assertEqual(self.trip.constraints.keys(), ['cost'])
+		self.assertGreater(self.trip.noptions(), tight)
+
+	def test_relax(self):
+		"""Relaxing a constraint restores the excluded options."""
+		self.trip.constrain('cost', [100])
+		self.trip.constrain('drive', [timedelta(hours=4)])
+		both = self.trip.noptions()
+		self.trip.relax('drive')
+		self.assertGreater(self.trip.noptions(), both)
+		self.trip.relax()
+		self.assertEqual(self.trip.noptions(), self.trip.total_options)
+
+	def test_constraints_evaluated_once(self):
+		"""Changing one constraint doesn't re-evaluate the others."""
+		calls = []
+		class Counting(Criterion):
+			name = 'counting'
+			def __call__(self, option):
+				calls.append(option)
+				return True
+		self.trip.constrain(Counting())
+		self.trip.constrain('cost', [100])
+		self.trip.constrain('cost', [70])
+		self.trip.options
+		self.assertEqual(len(calls), self.trip.total_options)
+
+
+class TestTripUpdates(unittest.TestCase):
+	"""Tests incremental addition/removal of ferries and car routes."""
+	def setUp(self):
+		dataset = {'car' : CAR_DATA, 'ferry' : FERRY_DATA}
+		lmap = LocationMap('A', 'B')
+		self.cardata, self.ferrydata = Parser(lmap).parse(dataset)
+		self.full = Trip('A', 'B', self.ferrydata, self.cardata)
+
+	def _assertSameOptions(self, trip, expected):
+		costs = [o.cost for o in trip.options]
+		if trip.store != 'list':
+			costs.sort()
+		self.assertEqual(costs, [o.cost for o in expected.options])
+		self.assertItemsEqual(list(trip.options), expected.options)
+
+	def test_add_ferry(self):
+		"""Adding a sailing matches a trip built with it."""
+		ferry = self.ferrydata[0]
+		for store in ('list', 'lazy'):
+			trip = Trip('A', 'B', self.ferrydata[1:], self.cardata,
+						store)
+			trip.add_ferry(ferry)
+			self.assertEqual(trip.total_options,
+							 self.full.total_options)
+			self._assertSameOptions(trip, self.full)
+
+	def test_remove_ferry(self):
+		"""Removing a sailing matches a trip built without it."""
+		ferry = self.ferrydata[-1]
+		expected = Trip('A', 'B', self.ferrydata[:-1], self.cardata)
+		before = self.full.total_options
+		self.full.remove_ferry(ferry)
+		self.assertLess(self.full.total_options, before)
+		self._assertSameOptions(self.full, expected)
+
+	def test_add_remove_car(self):
+		"""Car routes update only the affected routes."""
+		car = self.cardata[4] # Le Havre -> B, tolls
+		untouched = self.full.routes['OUT'][0]
+		self.full.constrain('cost', [100])
+		self.full.remove_car(car)
+		self.assertIs(self.full.routes['OUT'][0], untouched)
+		expected = Trip('A', 'B', self.ferrydata,
+						self.cardata[:4] + self.cardata[5:])
+		expected.constrain('cost', [100])
+		self._assertSameOptions(self.full, expected)
+		self.full.add_car(car)
+		self.assertEqual(self.full.total_options,
+						 len(self.full.out) * len(self.full.rtn))
+
+	@unittest.skipIf(numpy is None, "numpy not available")
+	def test_patch_table(self):
+		"""The columnar store and its masks are patched in place."""
+		trip = Trip('A', 'B', self.ferrydata, self.cardata, 'columnar')
+		expected = Trip('A', 'B', self.ferrydata, self.cardata)
+		for t in (trip, expected):
+			t.constrain('cost', [100])
+			t.constrain('arrival', [datetime(2000, 1, 2, 13, 0)])
+			t.remove_ferry(self.ferrydata[-1])
+			t.remove_car(self.cardata[4])
+			t.add_ferry(self.ferrydata[-1])
+		self.assertEqual(trip.total_options, expected.total_options)
+		self.assertEqual([o.cost for o in trip._base],
+						 [o.cost for o in expected._base])
+		self._assertSameOptions(trip, expected)
+		self.assertTrue(0 < trip.noptions() < trip.total_options)
+
+	def test_constraints_patched(self):
+		"""Constraints are only evaluated for the new options."""
+		calls = []
+		class Counting(Criterion):
+			name = 'counting'
+			def __call__(self, option):
+				calls.append(option)
+				return option.cost < 100
+		trip = Trip('A', 'B', self.ferrydata[1:], self.cardata)
+		trip.constrain(Counting())
+		before = trip.total_options
+		del calls[:]
+		trip.add_ferry(self.ferrydata[0])
+		self.assertEqual(len(calls), trip.total_options - before)
+		self.full.constrain(Counting())
+		self._assertSameOptions(trip, self.full)
+
+	def test_remove_missing(self):
+		ferry = self.ferrydata[0]._replace(cost=1)
+		self.assertRaises(ValueError, self.full.remove_ferry, ferry)
+
+
+class TestLazyTrip(unittest.TestCase):
+	"""Tests a Trip using the lazy option store."""
+	def setUp(self):
+		dataset = {'car' : CAR_DATA, 'ferry' : FERRY_DATA}
+		lmap = LocationMap('A', 'B')
+		cardata, ferrydata = Parser(lmap).parse(dataset)
+		self.trip = Trip('A', 'B', ferrydata, cardata, store='lazy')
+		self.eager = Trip('A', 'B', ferrydata, cardata)
+
+	def test_options_are_lazy(self):
+		"""Options are a view, not a materialised list."""
+		self.assertIsInstance(self.trip.options, OptionView)
+
+	def test_total_options(self):
+		"""The view reports the full cross-product size."""
+		self.assertEqual(self.trip.total_options,
+						 self.eager.total_options)
+
+	def test_same_options(self):
+		"""The view yields the same options as the eager store."""
+		self.assertItemsEqual(list(self.trip.options),
+							  self.eager.options)
+
+	def test_paging(self):
+		"""Slicing and indexing produce only the requested options."""
+		page = self.trip.options[:3]
+		self.assertEqual(len(page), 3)
+		self.assertEqual(page[2], self.trip.options[2])
+		self.assertEqual(self.trip.options[-1],
+						 list(self.trip.options)[-1])
+
+	def test_slice_bounds(self):
+		"""Negative bounds and steps slice as a list does."""
+		options = list(self.trip.options)
+		for index in (slice(-3, None), slice(1, -2), slice(-5, -1, 2),
+					  slice(None, None, -1), slice(-100, 2)):
+			self.assertEqual(self.trip.options[index], options[index])
+
+	def test_constrain(self):
+		"""Constraining a lazy trip matches the eager result."""
+		for trip in (self.trip, self.eager):
+			trip.constrain('cost', [70])
+		self.assertItemsEqual(list(self.trip.options),
+							  self.eager.options)
+		self.assertEqual(self.trip.noptions(), self.eager.noptions())
+		self.assertTrue(0 < self.trip.noptions() <
+						self.trip.total_options)
+
+
+
+@unittest.skipIf(numpy is None, "numpy not available")
+class TestColumnarTrip(unittest.TestCase):
+	"""Tests a Trip using the columnar option store."""
+	def setUp(self):
+		dataset = {'car' : CAR_DATA, 'ferry' : FERRY_DATA}
+		lmap = LocationMap('A', 'B')
+		cardata, ferrydata = Parser(lmap).parse(dataset)
+		self.trip = Trip('A', 'B', ferrydata, cardata,
+						 store='columnar')
+		self.eager = Trip('A', 'B', ferrydata, cardata)
+
+	def test_options_are_columnar(self):
+		self.assertIsInstance(self.trip.options, OptionTable)
+		self.assertEqual(self.trip.total_options,
+						 self.eager.total_options)
+
+	def test_sorted_by_cost(self):
+		"""Rows are ordered by cost as in the list store."""
+		self.assertEqual([o.cost for o in self.trip.options],
+						 [o.cost for o in self.eager.options])
+
+	def test_constrain(self):
+		"""Each criterion's mask matches the per-option predicate."""
+		constraints = [
+				('arrival', [datetime(2000, 1, 2, 13, 0)]),
+				('drive', [timedelta(hours=4)]),
+				('destdep', [datetime(2000, 1, 4, 13, 30)]),
+				('return', [datetime(2000, 1, 4, 21, 0)]),
+				('cost', [100]),
+				]
+		for criteria, values in constraints:
+			self.trip.constrain(criteria, values)
+			self.eager.constrain(criteria, values)
+			self.assertItemsEqual(list(self.trip.options),
+								  self.eager.options)
+		self.assertTrue(0 < len(self.trip.options) <
+						self.trip.total_options)
 
 if __name__ == '__main__':
 	unittest.main()
@@ -0,0 +1,239 @@
+"""Module for timetable queries over a SegmentMap.
+
+Scheduled (ferry) segments are held as connections sorted by
+departure. Unscheduled (car) segments can be taken at any time, so
+they're treated as transfers between locations, like footpaths in a
+public transport network.
+
+Earliest-arrival queries are answered with a single scan over the
+connections from the requested departure time (the Connection Scan
+Algorithm), so no itineraries need generating:
+
+	>>> timetable = Timetable(segmap)
+	>>> timetable.earliest_arrival(origin, destination, datetime(...))
+
+Profile queries scan the connections once in reverse, building the
+non-dominated (departure, arrival, cost) journeys from every location
+to the destination:
+
+	>>> timetable.profile(origin, destination, start, end)
+
+"""
+import bisect
+import heapq
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from travel import EPOCH
+from pareto import frontier
+
+_INF = float('inf')
+
+ProfileEntry = namedtuple('ProfileEntry', 'departure, arrival, cost')
+
+
+class Timetable(object):
+	"""Sorted connections and transfers from a SegmentMap.
+
+		segmap : travel.SegmentMap instance
+		connection : minimum time between reaching a location and
+					 boarding a scheduled departure (check-in time)
+
+	Connections are held in parallel lists ordered by departure, with
+	times in seconds since the epoch:
+
+		departures, arrivals : connection times
+		sources, targets : connection locations
+		costs : connection costs
+		segments : connection segments
+
+	Transfers map each location to (target, duration, segment) tuples
+	for its unscheduled segments. The timetable is a snapshot; create
+	a new one if the segment map changes.
+
+	"""
+	def __init__(self, segmap, connection=timedelta(0)):
+		self.connection = connection.total_seconds()
+		self.transfers = defaultdict(list)
+		scheduled = []
+		for (source, target), segments in segmap.items():
+			for segment in segments:
+				if segment.start.datetime is None:
+					duration = segment.link.duration.total_seconds()
+					self.transfers[source].append(
+							(target, duration, segment))
+				else:
+					scheduled.append((_seconds(segment.start.datetime),
+									  _seconds(segment.end.datetime),
+									  len(scheduled), segment))
+		scheduled.sort()
+		self.departures = [c[0] for c in scheduled]
+		self.arrivals = [c[1] for c in scheduled]
+		self.segments = [c[3] for c in scheduled]
+		self.sources = [seg.start.location for seg in self.segments]
+		self.targets = [seg.end.location for seg in self.segments]
+		self.costs = [seg.link.cost for seg in self.segments]
+		self._chains = {}
+
+	def __len__(self):
+		return len(self.departures)
+
+	def earliest_arrival(self, origin, destination, departure):
+		"""Earliest arrival at destination, leaving origin at departure.
+
+		Returns a datetime, or None if the destination can't be
+		reached.
+
+		"""
+		earliest, _ = self._scan(origin, destination,
+								 _seconds(departure))
+		arrival = earliest.get(destination)
+		if arrival is None:
+			return None
+		return EPOCH + timedelta(seconds=arrival)
+
+	def journey(self, origin, destination, departure):
+		"""Segments of an earliest-arrival journey, or None.
+
+		The segments can be passed to travel.Itinerary (with the same
+		connection time), which will schedule the car legs around the
+		sailings.
+
+		"""
+		earliest, via = self._scan(origin, destination,
+								   _seconds(departure))
+		if destination not in earliest:
+			return None
+		segments = []
+		location = destination
+		while via[location] is not None:
+			segment = via[location]
+			segments.append(segment)
+			location = segment.start.location
+		segments.reverse()
+		return segments
+
+	def profile(self, origin, destination, start, end):
+		"""Non-dominated journeys leaving origin between start and end.
+
+		Returns a list of ProfileEntry (departure, arrival, cost)
+		tuples ordered by departure, where no other journey leaves
+		later, arrives sooner and costs less (Pareto-optimal). Car
+		legs are scheduled to just meet the sailings, as for
+		travel.Itinerary. Journeys with no sailings aren't included.
+
+		"""
+		start, end = _seconds(start), _seconds(end)
+		# Journeys from the target of each connection, found in a
+		# single pass over the connections by decreasing departure.
+		# Entries are (ready, arrival, cost), where ready is the
+		# latest time the location can be reached.
+		journeys = defaultdict(list)
+		# Journeys leaving the origin in the window are collected as
+		# their first connection is boarded, before the entries there
+		# are pruned: a journey leaving after the window can dominate
+		# mid-journey, but isn't available from the origin.
+		boarding = defaultdict(list)
+		for location, duration, cost in self._transfers_from(origin):
+			boarding[location].append((duration, cost))
+		result = []
+		first = bisect.bisect_left(self.departures, start)
+		for i in xrange(len(self.departures) - 1, first - 1, -1):
+			candidates = []
+			for location, duration, cost in self._transfers_from(
+					self.targets[i]):
+				ready = self.arrivals[i] + duration
+				if location == destination:
+					candidates.append((ready, cost))
+				for entry in journeys[location]:
+					if entry[0] < ready:
+						break # later entries are ready earlier still
+					candidates.append((entry[1], cost + entry[2]))
+			ready = self.departures[i] - self.connection
+			options = [(arrival, cost + self.costs[i]) for arrival, cost
+					   in frontier(candidates, key=lambda c: c)]
+			for duration, cost in boarding.get(self.sources[i], ()):
+				if start <= ready - duration <= end:
+					result.extend((ready - duration, arrival,
+								   cost + total)
+								  for arrival, total in options)
+			entries = journeys[self.sources[i]]
+			for arrival, cost in options:
+				if not any(e[1] <= arrival and e[2] <= cost
+						   for e in entries):
+					entries.append((ready, arrival, cost))
+		result = frontier(result, key=lambda e: (-e[0], e[1], e[2]))
+		return [ProfileEntry(EPOCH + timedelta(seconds=departure),
+							 EPOCH + timedelta(seconds=arrival), cost)
+				for departure, arrival, cost in sorted(set(result))]
+
+	def _transfers_from(self, location):
+		# Locations reachable by transfers alone, as non-dominated
+		# (location, duration, cost) chains (including the location
+		# itself, with no duration or cost).
+		try:
+			return self._chains[location]
+		except KeyError:
+			pass
+		chains = [(location, 0.0, 0.0)]
+		stack = [(location, 0.0, 0.0, (location,))]
+		while stack:
+			source, time, cost, visited = stack.pop()
+			for target, duration, segment in self.transfers.get(
+					source, ()):
+				if target not in visited:
+					chain = (target, time + duration,
+							 cost + segment.link.cost)
+					chains.append(chain)
+					stack.append(chain + (visited + (target,),))
+		groups = defaultdict(list)
+		for chain in chains:
+			groups[chain[0]].append(chain)
+		result = []
+		for group in groups.values():
+			result.extend(frontier(group, key=lambda c: c[1:]))
+		self._chains[location] = result
+		return result
+
+	def _scan(self, origin, destination, start):
+		# Earliest time each location is reached (and the segment it
+		# was reached by), scanning connections departing from start
+		# until none can improve on the destination.
+		earliest, via = {}, {}
+		self._reach(earliest, via, origin, start, None)
+		best = earliest.get(destination, _INF)
+		departures, arrivals = self.departures, self.arrivals
+		sources, targets = self.sources, self.targets
+		connection = self.connection
+		for i in xrange(bisect.bisect_left(departures, start),
+						len(departures)):
+			if departures[i] >= best:
+				break # no later departure can arrive sooner
+			if (earliest.get(sources[i], _INF) + connection
+					<= departures[i] and
+					arrivals[i] < earliest.get(targets[i], _INF)):
+				self._reach(earliest, via, targets[i], arrivals[i],
+							self.segments[i])
+				best = earliest.get(destination, _INF)
+		return earliest, via
+
+	def _reach(self, earliest, via, location, time, segment):
+		# Record reaching a location, then follow transfers from it
+		# (shortest durations first, as transfers may chain).
+		heap = [(time, location, segment)]
+		while heap:
+			time, location, segment = heapq.heappop(heap)
+			if time >= earliest.get(location, _INF):
+				continue
+			earliest[location] = time
+			via[location] = segment
+			for target, duration, transfer in self.transfers.get(
+					location, ()):
+				if time + duration < earliest.get(target, _INF):
+					heapq.heappush(heap,
+								   (time + duration, target, transfer))
+
+
+def _seconds(dt):
+	# Seconds since the epoch for a (naive) datetime.
+	return (dt - EPOCH).total_seconds()
@@ -16,22 +16,26 @@ for now.
 
 """
 import copy
+import gc
+import heapq
 import itertools
-from collections import defaultdict, namedtuple
-from datetime import timedelta
-from places import LocationMap
+from collections import defaultdict, namedtuple, OrderedDict
+from array import array
+from datetime import datetime, timedelta
+from places import LocationMap, DEFAULT_NETWORK, time_difference
+from exdata import read_files, prune_cardata, prune_ferrydata
+from criteria import from_name, compile_criteria
+from pareto import frontier
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+class BaseWaypoint(object):
+	"""Behaviour shared by Waypoint and FrozenWaypoint."""
+	__slots__ = ()
 
-class Waypoint(object):
-	"""A waypoint is a node in an itinerary.
-	
-	Waypoints have location and an optional date/time. Where the
-	latter is not specified, it makes the waypoint suitable for
-	merging with another at the same location and specified date/time.
-
-		location : places.Location instance
-		datetime : datetime.datetime instance (optional)
-	
-	"""
 	daymap = {1 : 'Mon', 2 : 'Tue', 3 : 'Wed', 4 : 'Thu', 5 : 'Fri',
 			  6 : 'Sat', 7 : 'Sun'}
 
@@ -39,23 +43,22 @@ class Waypoint(object):
 				6 : 'Jun', 7 : 'Jul', 8 : 'Aug', 9 : 'Sep', 10: 'Oct',
 				11: 'Nov', 12: 'Dec'}
 
-	def __init__(self, location, datetime=None):
-		self.location = location
-		self.datetime = datetime
-
 	def merge(self, other):
-		"""Merge waypoint with another.
+		"""Merge waypoint with another, returning the result.
 		
 		Waypoints must be at the same location. If this waypoint has
-		no datetime value, the other's is used.
+		no datetime value, the other's is used. Neither waypoint is
+		modified; the merged waypoint is whichever of the two carries
+		the datetime.
 		
 		"""
 		if self.location != other.location:
 			raise ValueError("Waypoint locations different.")
 		elif self.datetime is None:
-			self.datetime = other.datetime
+			return other
 		elif other.datetime and self.datetime != other.datetime:
 			raise ValueError("Waypoint datetimes differ.")
+		return self
 
 	def __str__(self):
 		return '{}, {} ({})'.format(self.location.town,
@@ -74,6 +77,22 @@ class Waypoint(object):
 			return string.format(weekday, dt.day, month, dt.hour, 
 								 dt.minute)
 
+
+class Waypoint(BaseWaypoint):
+	"""A waypoint is a node in an itinerary.
+	
+	Waypoints have location and an optional date/time. Where the
+	latter is not specified, it makes the waypoint suitable for
+	merging with another at the same location and specified date/time.
+
+		location : places.Location instance
+		datetime : datetime.datetime instance (optional)
+	
+	"""
+	def __init__(self, location, datetime=None):
+		self.location = location
+		self.datetime = datetime
+
 	def __eq__(self, other):
 		# Equality is assumed when both locations and datetimes match.
 		if (self.location == other.location and
@@ -82,23 +101,26 @@ class Waypoint(object):
 		else:
 			return False
 
+	def __ne__(self, other):
+		return not self == other
 
-class Link(object):
-	"""A link is a transition between waypoints.
 
-	Links have a duration, a cost and a note. Both duration and cost
-	are required; the duration may be used to calculate undefined
-	waypoint datetime attributes.
+_FrozenWaypoint = namedtuple('Waypoint', 'location, datetime')
+class FrozenWaypoint(BaseWaypoint, _FrozenWaypoint):
+	"""An immutable, hashable waypoint (see Waypoint).
 
-		duration : datetime.timedelta instance
-		cost : financial cost of journey (fuel, fares, tolls, etc.)
-		note : journey description for disambig./clarity
+	Frozen waypoints have no instance dictionary and compare and hash
+	field-wise.
 
 	"""
-	def __init__(self, duration, cost, note=''):
-		self.duration = duration
-		self.cost = cost
-		self.note = note
+	__slots__ = ()
+	def __new__(cls, location, datetime=None):
+		return _FrozenWaypoint.__new__(cls, location, datetime)
+
+
+class BaseLink(object):
+	"""Behaviour shared by Link and FrozenLink."""
+	__slots__ = ()
 
 	def __str__(self):
 		h, s = divmod(int(self.duration.total_seconds()), 3600)
@@ -112,69 +134,91 @@ class Link(object):
 											      note)
 		return string
 
+
+class Link(BaseLink):
+	"""A link is a transition between waypoints.
+
+	Links have a duration, a cost and a note. Both duration and cost
+	are required; the duration may be used to calculate undefined
+	waypoint datetime attributes.
+
+		duration : datetime.timedelta instance
+		cost : financial cost of journey (fuel, fares, tolls, etc.)
+		note : journey description for disambig./clarity
+
+	"""
+	def __init__(self, duration, cost, note=''):
+		self.duration = duration
+		self.cost = cost
+		self.note = note
+
 	def __eq__(self, other):
-		return self.__dict__ == other.__dict__
+		return (self.duration == other.duration and
+				self.cost == other.cost and
+				self.note == other.note)
 
+	def __ne__(self, other):
+		return not self == other
 
-class Segment(object):
-	"""An itinerary segment.
 
-	A segment consists of two waypoints and a link.
+_FrozenLink = namedtuple('Link', 'duration, cost, note')
+class FrozenLink(BaseLink, _FrozenLink):
+	"""An immutable, hashable link (see Link)."""
+	__slots__ = ()
+	def __new__(cls, duration, cost, note=''):
+		return _FrozenLink.__new__(cls, duration, cost, note)
 
-		start, end : Waypoint instances
-		link : Link instance
+
+class BaseSegment(object):
+	"""Behaviour shared by Segment and FrozenSegment.
+
+	Subclasses define the waypoint and link types used when creating
+	segments from external data.
 
 	"""
-	def __init__(self, start, end, link):
-		self._validate_input(start, end, link)
-		self.start = start
-		self.end = end
-		self.link = link
-		# TODO: Add switch and methods for deriving WP date/time
+	__slots__ = ()
 
 	@classmethod
 	def from_CarData(cls, car_data):
 		"""Create a segment from car data."""
-		start = Waypoint(car_data.source, None)
-		end = Waypoint(car_data.destination, None)
-		link = Link(car_data.duration, car_data.cost, car_data.note)
+		start = cls.waypoint_type(car_data.source, None)
+		end = cls.waypoint_type(car_data.destination, None)
+		link = cls.link_type(car_data.duration, car_data.cost,
+							 car_data.note)
 		return cls(start, end, link)
 
 	@classmethod
 	def from_FerryData(cls, ferry_data):
 		"""Create a segment from ferry data."""
-		start = Waypoint(ferry_data.source, ferry_data.dep)
-		end = Waypoint(ferry_data.destination, ferry_data.arr)
+		start = cls.waypoint_type(ferry_data.source, ferry_data.dep)
+		end = cls.waypoint_type(ferry_data.destination, ferry_data.arr)
 		duration = cls._calculate_border_duration(start, end)
 		note = ferry_data.operator
 		if ferry_data.note:
 			note = '{}, {}'.format(note, ferry_data.note)
-		link = Link(duration, ferry_data.cost, note)
+		link = cls.link_type(duration, ferry_data.cost, note)
 		return cls(start, end, link)
 
 	@staticmethod
 	def _calculate_border_duration(start, end):
 		# Crude timezone handling for border crossing.
 		duration = end.datetime - start.datetime
-		countries = start.location.country, end.location.country
-		if countries == ('UK', 'FR'):
-			duration -= timedelta(hours=1)
-		elif countries == ('FR', 'UK'):
-			duration += timedelta(hours=1)
-		return duration
+		return duration - time_difference(start.location.country,
+										  end.location.country)
+
+	@classmethod
+	def _unchecked(cls, start, end, link):
+		# A segment known to be valid, e.g. with a link duration
+		# derived from its waypoints (see SegmentMap.from_columns).
+		return cls(start, end, link)
 
 	@staticmethod
 	def _validate_input(start, end, link):
 		# Make sure the Segment is valid (link duration is compatible
 		# with start/end datetimes.)
 		if all((start.datetime, end.datetime, link.duration)):
-
-			switch = {
-					('UK', 'FR') : start.datetime + timedelta(hours=1),
-					('FR', 'UK') : start.datetime - timedelta(hours=1)
-					}
-			key = start.location.country, end.location.country
-			start_eff = switch.get(key, start.datetime) 
+			start_eff = start.datetime + time_difference(
+					start.location.country, end.location.country)
 			if link.duration != end.datetime - start_eff:
 				raise ValueError("Over-constrained Segment.")
 
@@ -185,86 +229,345 @@ class Segment(object):
 										  self.link)
 		return string.replace('() ', '')
 
+
+class Segment(BaseSegment):
+	"""An itinerary segment.
+
+	A segment consists of two waypoints and a link.
+
+		start, end : Waypoint instances
+		link : Link instance
+
+	"""
+	waypoint_type = Waypoint
+	link_type = Link
+
+	def __init__(self, start, end, link):
+		self._validate_input(start, end, link)
+		self.start = start
+		self.end = end
+		self.link = link
+		# TODO: Add switch and methods for deriving WP date/time
+
 	def __eq__(self, other):
-		return self.__dict__ == other.__dict__
+		return (self.start == other.start and
+				self.end == other.end and
+				self.link == other.link)
+
+	def __ne__(self, other):
+		return not self == other
+
+
+_FrozenSegment = namedtuple('Segment', 'start, end, link')
+class FrozenSegment(BaseSegment, _FrozenSegment):
+	"""An immutable, hashable segment of frozen waypoints and link.
+
+	Frozen segments (see Segment) have no instance dictionary and
+	compare and hash field-wise, so they can be used in sets and as
+	dictionary keys.
+
+	"""
+	__slots__ = ()
+	waypoint_type = FrozenWaypoint
+	link_type = FrozenLink
+
+	def __new__(cls, start, end, link):
+		cls._validate_input(start, end, link)
+		return _FrozenSegment.__new__(cls, start, end, link)
+
+	@classmethod
+	def _unchecked(cls, start, end, link):
+		# Skip validation (see BaseSegment).
+		return tuple.__new__(cls, (start, end, link))
 
 
 class SegmentMap(defaultdict):
 	"""A mapping of location-pairs to lists of Segments.
 
-	Segments are generated from externally sourced data.
+	Segments are generated from externally sourced data. They are
+	never modified once created, so frozen (slotted, hashable)
+	segments are used by default. The data may be any iterables of
+	records, e.g. those streamed from disk by exdata.Parser, and is
+	consumed a record at a time.
+
+	With prune=True, dominated car route variants and sailings are
+	dropped before segments are created (see exdata.prune_cardata and
+	exdata.prune_ferrydata); the numbers dropped are in the pruned
+	attribute, keyed 'car' and 'ferry'. Segments added later aren't
+	pruned.
 
 	"""
-	def __init__(self, list_car_data, list_ferry_data):
+	segment_type = FrozenSegment
+
+	def __init__(self, list_car_data, list_ferry_data, prune=False):
 		defaultdict.__init__(self, list)
+		self.table = []
+		self._ids = {}
+		self.pruned = {'car' : 0, 'ferry' : 0}
+		if prune:
+			list_car_data, self.pruned['car'] = prune_cardata(
+					list_car_data)
+			list_ferry_data, self.pruned['ferry'] = prune_ferrydata(
+					list_ferry_data)
 		for route in list_car_data:
-			self[route[:2]].append(Segment.from_CarData(route))
+			self.add_car(route)
 		for route in list_ferry_data:
-			self[route[:2]].append(Segment.from_FerryData(route))
+			self.add_ferry(route)
+
+	@classmethod
+	def from_files(cls, parser, car_files=(), ferry_files=(),
+				   processes=None, prune=False):
+		"""Create a map from many data files, read in parallel.
+
+		See exdata.read_files; records from all files are merged
+		into the one map.
+
+		"""
+		cd, fd = read_files(parser, car_files, ferry_files, processes)
+		return cls(cd, fd, prune)
+
+	@classmethod
+	def from_columns(cls, car_columns=None, ferry_columns=None):
+		"""Create a map from columns parsed in bulk (requires numpy).
+
+		Columns are dictionaries of arrays keyed by CarData/FerryData
+		field, as returned by exdata.Parser.bulk_cardata and
+		bulk_ferrydata. Rows are grouped by location pair and the
+		segments of each group built from whole columns, without
+		creating intermediate records. Segments are in row order
+		within each pair, as for instantiation; they aren't pruned.
+
+		"""
+		segmap = cls((), ())
+		# Segments hold no reference cycles; don't let the collector
+		# repeatedly traverse them while they're allocated.
+		enabled = gc.isenabled()
+		gc.disable()
+		try:
+			if car_columns is not None:
+				segmap._add_columns(car_columns, False)
+			if ferry_columns is not None:
+				segmap._add_columns(ferry_columns, True)
+		finally:
+			if enabled:
+				gc.enable()
+		return segmap
+
+	def _add_columns(self, columns, scheduled):
+		# Add segments for bulk-parsed car or ferry (scheduled) rows,
+		# grouped by location pair.
+		segment = self.segment_type._unchecked
+		waypoint = self.segment_type.waypoint_type
+		link = self.segment_type.link_type
+		source = columns['source'].tolist()
+		destination = columns['destination'].tolist()
+		codes = {}
+		src = np.array([codes.setdefault(loc, len(codes))
+						for loc in source], dtype=np.int64)
+		dst = np.array([codes.setdefault(loc, len(codes))
+						for loc in destination], dtype=np.int64)
+		__, first, inverse = np.unique(src * len(codes) + dst,
+									   return_index=True,
+									   return_inverse=True)
+		keys = [(source[i], destination[i]) for i in first.tolist()]
+		cost = columns['cost'].tolist()
+		if scheduled:
+			# durations less the time difference of each pair
+			offsets = np.array([time_difference(s.country, d.country)
+								for s, d in keys],
+							   dtype='timedelta64[m]')
+			dep, arr = columns['dep'], columns['arr']
+			duration = (arr - dep - offsets[inverse]).astype(object)
+			operator, note = columns['operator'], columns['note']
+			note = np.where(note == '', operator, np.char.add(
+					np.char.add(operator, ', '), note)).tolist()
+			dep = dep.astype(object).tolist()
+			arr = arr.astype(object).tolist()
+		else:
+			duration = columns['duration'].astype(object)
+			note = columns['note'].tolist()
+		duration = duration.tolist()
+		order = np.argsort(inverse, kind='mergesort').tolist()
+		bounds = np.cumsum(np.bincount(inverse)).tolist()
+		lo = 0
+		for (s, d), hi in zip(keys, bounds):
+			rows = order[lo:hi]
+			lo = hi
+			if scheduled:
+				segments = [segment(waypoint(s, dep[i]),
+									waypoint(d, arr[i]),
+									link(duration[i], cost[i], note[i]))
+							for i in rows]
+			else:
+				start, end = waypoint(s), waypoint(d) # shared
+				segments = [segment(start, end,
+									link(duration[i], cost[i], note[i]))
+							for i in rows]
+			self[s, d].extend(segments)
+
+	def index(self, segment):
+		"""Integer ID of a segment in the shared segment table.
+
+		Segments are added to the table on first request; IDs are
+		stable for the lifetime of the map.
+
+		"""
+		try:
+			return self._ids[segment]
+		except KeyError:
+			self._ids[segment] = id_ = len(self.table)
+			self.table.append(segment)
+			return id_
+
+	def add_car(self, car_data):
+		"""Add a segment for car route data, returning its key."""
+		segment = self.segment_type.from_CarData(car_data)
+		self[car_data[:2]].append(segment)
+		return car_data[:2]
+
+	def add_ferry(self, ferry_data):
+		"""Add a segment for ferry data, returning its key."""
+		segment = self.segment_type.from_FerryData(ferry_data)
+		self[ferry_data[:2]].append(segment)
+		return ferry_data[:2]
+
+	def remove_car(self, car_data):
+		"""Remove the segment for car route data, returning its key.
+
+		Raises ValueError if there is no such segment.
+
+		"""
+		segment = self.segment_type.from_CarData(car_data)
+		self[car_data[:2]].remove(segment)
+		return car_data[:2]
+
+	def remove_ferry(self, ferry_data):
+		"""Remove the segment for ferry data, returning its key.
+
+		Raises ValueError if there is no such segment.
+
+		"""
+		segment = self.segment_type.from_FerryData(ferry_data)
+		self[ferry_data[:2]].remove(segment)
+		return ferry_data[:2]
 
 
 class Itinerary(list):
-	"""A sequence of joined segments (merged end/start waypoints)."""
-	def __init__(self, segments):
-		"""Instantiated with a list of Segment instances."""
+	"""A sequence of joined segments (merged end/start waypoints).
+
+	Segments (and their waypoints and links) are treated as immutable
+	and shared rather than copied: only waypoints whose datetime is
+	derived from the schedule are created.
+
+	Car (unscheduled) legs leading to a sailing are scheduled to arrive
+	the connection time (a timedelta, for check-in) before it departs.
+
+	Aggregates (cost, duration, drive, arrival) are computed once on
+	construction. Modifying the itinerary through the list methods
+	discards them and they are recomputed on next access.
+
+	"""
+	def __init__(self, segments, connection=timedelta(0)):
+		"""Instantiated with a sequence of Segment instances."""
 		list.__init__(self)
-		self._collapse(segments)
-		self._propagate_schedule()
-
-	def _collapse(self, segments):
-		# Collapse segments. Joins segments together sensibly. Init
-		# helper method.
-		self.append(segments[0].start) # initial waypoint
-		for i in xrange(len(segments)):
-			seg = segments[i]
+		# Links of scheduled (timetabled) segments, by identity.
+		self._scheduled = set(id(seg.link) for seg in segments
+							  if seg.start.datetime is not None)
+		self._collapse(segments, connection)
+		self._aggregates = self._aggregate()
+
+	def _collapse(self, segments, connection):
+		# Collapse segments into alternating waypoints and links.
+		# Init helper method.
+		waypoints = self._schedule(segments, connection)
+		self.append(waypoints[0]) # initial waypoint
+		for seg, waypoint in zip(segments, waypoints[1:]):
 			self.append(seg.link)
-			try:
-				next_ = segments[i+1]
-				seg.end.merge(next_.start)
-			except IndexError:
-				pass
-			self.append(seg.end)
-
-	def _propagate_schedule(self):
-		# Propagates date/time information through the itinerary.
-		wps, links = self[::2], self[1::2]
-		for i in xrange(len(links)):
-			wp_a, wp_b = wps[i], wps[i+1]
-			link = links[i]
+			self.append(waypoint)
+
+	@staticmethod
+	def _schedule(segments, connection=timedelta(0)):
+		# Waypoints along a sequence of segments: each segment's end
+		# merged with the next segment's start, with date/time
+		# information propagated forwards and backwards (allowing
+		# the connection time before boarding a scheduled segment).
+		waypoints = [segments[0].start]
+		for i, seg in enumerate(segments):
+			if i + 1 < len(segments):
+				waypoints.append(seg.end.merge(segments[i+1].start))
+			else:
+				waypoints.append(seg.end)
+
+		for i, seg in enumerate(segments):
+			wp_a, wp_b = waypoints[i], waypoints[i+1]
 			if wp_a.datetime and wp_b.datetime is None:
-				wp_b.datetime = wp_a.datetime + link.duration
+				dt = wp_a.datetime + seg.link.duration
+				waypoints[i+1] = type(wp_b)(wp_b.location, dt)
 
-		wps, links = self[::-2], self[-2::-2]
-		for i in xrange(len(links)):
-			wp_a, wp_b = wps[i], wps[i+1]
-			link = links[i]
+		for i in reversed(xrange(len(segments))):
+			wp_a, wp_b = waypoints[i+1], waypoints[i]
 			if wp_a.datetime and wp_b.datetime is None:
-				wp_b.datetime = wp_a.datetime - link.duration
+				dt = wp_a.datetime - segments[i].link.duration
+				if (i + 1 < len(segments) and
+						segments[i+1].start.datetime is not None):
+					dt -= connection
+				waypoints[i] = type(wp_b)(wp_b.location, dt)
+		return waypoints
+
+	def _aggregate(self):
+		# Totals over the itinerary's links (cost, duration and
+		# unscheduled/driving duration) and the arrival datetime.
+		links = [e for e in self if isinstance(e, BaseLink)]
+		cost = sum(link.cost for link in links)
+		duration = sum((link.duration for link in links), timedelta(0))
+		drive = sum((link.duration for link in links
+					 if id(link) not in self._scheduled), timedelta(0))
+		return cost, duration, drive, self[-1].datetime
+
+	def _totals(self):
+		# Cached aggregates, recomputed after modification.
+		if self._aggregates is None:
+			self._aggregates = self._aggregate()
+		return self._aggregates
+
+	def invalidate(self):
+		"""Discard cached aggregates (done by all list methods)."""
+		self._aggregates = None
 
 	@property
 	def cost(self):
 		"""Total cost for the route."""
-		total = []
-		for element in self:
-			# This is very lazy...
-			try:
-				total.append(element.cost)
-			except AttributeError:
-				pass
-		return sum(total)
+		return self._totals()[0]
+
+	@property
+	def duration(self):
+		"""Total travelling duration (sum of link durations)."""
+		return self._totals()[1]
+
+	@property
+	def drive(self):
+		"""Total driving duration (unscheduled links)."""
+		return self._totals()[2]
 
 	@property
 	def arrival(self):
 		"""Destination arrival date/time."""
-		return self[-1].datetime 
+		return self._totals()[3]
 	
+	def _at_port(self, index):
+		# True if the waypoint at index is the start or end of a
+		# scheduled (ferry) link.
+		return any(id(self[i]) in self._scheduled
+				   for i in (index - 1, index + 1)
+				   if 0 <= i < len(self))
+
 	def pprint(self):
 		"""Multi-line, formatted string overview of the itinerary."""
 		string = []
 		for i, e in enumerate(self):
-			e_is_link = isinstance(e, Link)
-			e_is_port = (isinstance(e, Waypoint) and
-					     e.location in LocationMap.ports['ALL'])
+			e_is_link = isinstance(e, BaseLink)
+			e_is_port = (isinstance(e, BaseWaypoint) and
+						 self._at_port(i))
 			if e_is_link:
 				e = '  {}'.format(e)
 			if e_is_port:
@@ -275,52 +578,57 @@ class Itinerary(list):
 		return '\n'.join(string)
 
 
+def _invalidating(name):
+	# Wrap a list method so it discards an itinerary's aggregates.
+	method = getattr(list, name)
+	def wrapper(self, *args):
+		self._aggregates = None
+		return method(self, *args)
+	wrapper.__name__ = name
+	wrapper.__doc__ = method.__doc__
+	return wrapper
+
+for _name in ('__setitem__', '__delitem__', '__setslice__',
+			  '__delslice__', '__iadd__', '__imul__', 'append',
+			  'extend', 'insert', 'pop', 'remove', 'reverse', 'sort'):
+	setattr(Itinerary, _name, _invalidating(_name))
+del _name
+
+
 class Route(list):
 	"""A route a set of itineraries corresponding to a path.
 	
 	The path is a list of Location instances. The itineraries are
 	calculated permutations of location-pair Segments along the path
 	(provided by a SegmentMap instance).
+
+	An expander (PathExpander) may be given to share permutations of
+	common sub-paths with other routes.
+
+	Permutations where a scheduled segment (e.g. a sailing) departs
+	before it can be reached from an earlier scheduled segment are
+	pruned during generation. The optional connection (a timedelta)
+	is the minimum check-in/connection time required before a
+	scheduled departure; car legs leading to a sailing are scheduled
+	to allow for it.
 	
 	"""
-	# TODO: Tighten this up. Initially the recursive permutation
-	# algorithm was intended to generate itineraries directly rather
-	# than sequences of segments. The method ran into early issues
-	# with prematurely mutated waypoints (causing problems in future
-	# itinerary-creation using the same references). This is the
-	# result of a "workaround" which turned out to be a little naive
-	# as, although it exposed the real cause of the issue (mutable
-	# waypoints, not the recursion per se), it has the same problems
-	# albeit with a more complex dataflow. _generate_permutations()
-	# could just become _generate_itineraries, and rather than
-	# instantiating itineraries with a sequence of segments, they
-	# could be appended in-place. As long as the itinerary creates
-	# deepcopies of waypoints when calculating datetimes, there
-	# shouldn't be an issue with mutability.
-
-	def __init__(self, path, segmap):
+	def __init__(self, path, segmap, connection=timedelta(0),
+				 expander=None):
 		self.path = path
 		self.segmap = segmap
+		self.connection = connection
+		if expander is None:
+			expander = PathExpander(segmap, connection)
+		self.expander = expander
 		list.__init__(self)
 		self._generate_itineraries()
 
 	def _generate_itineraries(self):
-		# Create itineraries from Segment-sequence permutations.
-		permutations = self._generate_permutations(self.path)
-		for segment_sequence in permutations:
-			self.append(Itinerary(copy.deepcopy(segment_sequence)))
-
-	def _generate_permutations(self, path, history=[]):
-		# Generate permutations of segments along the path.
-		if len(path) == 1: return [history] # end of path
-		histories = []
-		for segment in self.segmap[tuple(path[:2])]:
-			new_history = history + [segment]
-			futures = self._generate_permutations(path[1:], 
-												  new_history)
-			for future in futures:
-				histories.append(future)
-		return histories
+		# Create itineraries from Segment-sequence permutations. The
+		# segments are shared; itineraries never modify them.
+		for segment_sequence in self.expander.expand(self.path):
+			self.append(Itinerary(segment_sequence, self.connection))
 
 	@property
 	def cost(self):
@@ -329,109 +637,716 @@ class Route(list):
 		return (min(cost_list), max(cost_list))
 
 
+def permutations(path, segmap, connection=timedelta(0)):
+	"""Feasible permutations of segments along a path.
+
+	Returns a list of segment sequences, one segment per location-pair
+	along the path. Scheduled segments that can't be reached from an
+	earlier scheduled segment (allowing for the connection time) are
+	pruned; see Route. Use a PathExpander to share the work between
+	several paths.
+
+	"""
+	return PathExpander(segmap, connection).expand(path)
+
+
+class PathExpander(object):
+	"""Memoised expansion of paths into segment permutations.
+
+	The expansion of each path suffix is computed once and shared by
+	every path ending with it (e.g. Le Havre -> destination, for all
+	outward routes via Le Havre), in both directions. Sequences are
+	tuples; the memoised suffix expansions are shared, but each
+	sequence is a new tuple (head + tail) built from them.
+
+	Where a suffix contains scheduled segments its expansion depends
+	on the earliest time it can be started (connections are pruned as
+	for Route), so the memo is keyed on that time as well. The memo
+	must be cleared if the segment map changes.
+
+	"""
+	def __init__(self, segmap, connection=timedelta(0)):
+		self.segmap = segmap
+		self.connection = connection
+		self._memo = {}
+		self._unscheduled = {}
+
+	def expand(self, path):
+		"""Feasible segment permutations along a path."""
+		return self._expand(tuple(path), None)
+
+	def clear(self):
+		"""Discard memoised expansions."""
+		self._memo.clear()
+		self._unscheduled.clear()
+
+	def _expand(self, path, ready):
+		# Permutations along the path given the earliest datetime at
+		# its start (ready), if known.
+		if ready is not None and self._is_unscheduled(path):
+			ready = None # no departures to prune
+		key = path, ready
+		try:
+			return self._memo[key]
+		except KeyError:
+			pass
+		if len(path) == 1:
+			result = [()] # end of path
+		else:
+			result = []
+			for segment in self.segmap[path[:2]]:
+				departure = segment.start.datetime
+				if departure is None:
+					if ready is not None:
+						arrival = ready + segment.link.duration
+					else:
+						arrival = None
+				elif (ready is not None and
+						ready + self.connection > departure):
+					continue # infeasible connection
+				else:
+					arrival = segment.end.datetime
+				head = (segment,)
+				for tail in self._expand(path[1:], arrival):
+					result.append(head + tail)
+		self._memo[key] = result
+		return result
+
+	def _is_unscheduled(self, path):
+		# True if no segment along the path has a scheduled start.
+		try:
+			return self._unscheduled[path]
+		except KeyError:
+			pass
+		result = (len(path) == 1 or
+				  (all(seg.start.datetime is None
+					   for seg in self.segmap[path[:2]]) and
+				   self._is_unscheduled(path[1:])))
+		self._unscheduled[path] = result
+		return result
+
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class ItineraryStore(object):
+	"""An array-backed store of itineraries.
+
+	Each itinerary is a row of integer segment IDs into the shared
+	segment table of a SegmentMap (see SegmentMap.index), held
+	together with the other rows in flat arrays:
+
+		segments : segment IDs of all rows, concatenated
+		offsets : start of each row in segments (plus the end)
+		departure, arrival : derived datetimes in seconds since the
+							 epoch (NaN where unscheduled)
+		cost : total cost of each row
+
+	Itinerary instances are only created on request (indexing or
+	iteration), e.g. for pprint. The connection time is applied when
+	scheduling as for Itinerary.
+
+		>>> store = ItineraryStore.from_paths(lmap.paths['OUT'], segmap)
+		>>> print store[0].pprint()
+
+	"""
+	def __init__(self, segmap, connection=timedelta(0)):
+		self.segmap = segmap
+		self.connection = connection
+		self.segments = array('l')
+		self.offsets = array('l', [0])
+		self.departure = array('d')
+		self.arrival = array('d')
+		self.cost = array('d')
+
+	@classmethod
+	def from_paths(cls, paths, segmap, connection=timedelta(0)):
+		"""Create a store of the segment permutations along paths."""
+		store = cls(segmap, connection)
+		expander = PathExpander(segmap, connection)
+		for path in paths:
+			store.extend(expander.expand(path))
+		return store
+
+	def add(self, segments):
+		"""Add a row for a sequence of segments."""
+		waypoints = Itinerary._schedule(segments, self.connection)
+		self.segments.extend(self.segmap.index(seg) for seg in segments)
+		self.offsets.append(len(self.segments))
+		self.departure.append(self._seconds(waypoints[0].datetime))
+		self.arrival.append(self._seconds(waypoints[-1].datetime))
+		self.cost.append(sum(seg.link.cost for seg in segments))
+
+	def extend(self, sequences):
+		"""Add a row for each of a number of segment sequences."""
+		for segments in sequences:
+			self.add(segments)
+
+	@staticmethod
+	def _seconds(dt):
+		# Seconds since the epoch for a (naive) datetime, or NaN.
+		if dt is None:
+			return float('nan')
+		return (dt - EPOCH).total_seconds()
+
+	def __len__(self):
+		return len(self.offsets) - 1
+
+	def row(self, index):
+		"""Segment IDs for a row."""
+		if index < 0:
+			index += len(self)
+		return self.segments[self.offsets[index]:self.offsets[index+1]]
+
+	def itinerary(self, index):
+		"""Materialise the Itinerary for a row."""
+		table = self.segmap.table
+		return Itinerary([table[i] for i in self.row(index)],
+						 self.connection)
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return [self.itinerary(i)
+					for i in xrange(*index.indices(len(self)))]
+		return self.itinerary(index)
+
+	def __iter__(self):
+		for index in xrange(len(self)):
+			yield self.itinerary(index)
+
+
 Option = namedtuple('Option', 'out, rtn, cost, arrival_time')
 
 
+def make_option(out, rtn):
+	"""Combine outward and return itineraries into an Option."""
+	return Option(out, rtn, (out.cost + rtn.cost)/4, out.arrival)
+
+
+class OptionTable(object):
+	"""A columnar (NumPy) store of the (out, rtn) combinations.
+
+	Rather than a list of Option tuples, the table holds one array per
+	attribute used for constraining, indexed by option, so criteria
+	can be evaluated as vectorised boolean masks. Rows are sorted by
+	cost, as with the list store. Requires numpy.
+
+		out_index, rtn_index : integer indices into out/rtn
+		cost : option cost
+		arrival : destination arrival (datetime64)
+		drive : post-ferry outward driving duration (timedelta64)
+		destdep : destination departure (datetime64)
+		rtn_arrival : origin arrival (datetime64)
+		selected : boolean mask of the rows in the table
+
+	Option instances are only created when the table is iterated or
+	indexed. By default the table holds every combination; pass
+	out_index and rtn_index for a table of particular combinations.
+
+	"""
+	# Per-row columns (see patch).
+	columns = ('out_index', 'rtn_index', 'cost', 'arrival', 'drive',
+			   'destdep', 'rtn_arrival', 'selected')
+
+	def __init__(self, out, rtn, out_index=None, rtn_index=None):
+		if np is None:
+			raise ImportError("The columnar store requires numpy.")
+		self.out = out
+		self.rtn = rtn
+		if out_index is None:
+			out_index = np.repeat(np.arange(len(out)), len(rtn))
+			rtn_index = np.tile(np.arange(len(rtn)), len(out))
+		cost = (self._column(out, lambda i: i.cost, float)[out_index] +
+				self._column(rtn, lambda i: i.cost, float)[rtn_index]
+				) / 4
+		order = np.argsort(cost, kind='mergesort')
+		self.out_index = out_index = out_index[order]
+		self.rtn_index = rtn_index = rtn_index[order]
+		self.cost = cost[order]
+		self.arrival = self._column(out, lambda i: i[-1].datetime,
+									'datetime64[s]')[out_index]
+		self.drive = self._column(out, lambda i: i[-2].duration,
+								  'timedelta64[s]')[out_index]
+		self.destdep = self._column(rtn, lambda i: i[0].datetime,
+									'datetime64[s]')[rtn_index]
+		self.rtn_arrival = self._column(rtn, lambda i: i[-1].datetime,
+										'datetime64[s]')[rtn_index]
+		self.selected = np.ones(len(self.cost), dtype=bool)
+
+	@staticmethod
+	def _column(itineraries, attr, dtype):
+		# Per-itinerary attribute array.
+		return np.array([attr(i) for i in itineraries], dtype=dtype)
+
+	def __iter__(self):
+		for row in np.flatnonzero(self.selected):
+			yield self._option(row)
+
+	def __len__(self):
+		return int(np.count_nonzero(self.selected))
+
+	def __getitem__(self, index):
+		rows = np.flatnonzero(self.selected)[index]
+		if isinstance(index, slice):
+			return [self._option(row) for row in rows]
+		return self._option(rows)
+
+	def _option(self, row):
+		# Build the Option for a table row.
+		return make_option(self.out[self.out_index[row]],
+						   self.rtn[self.rtn_index[row]])
+
+	def where(self, mask):
+		"""Return a table restricted to the rows of a boolean mask.
+
+		The columns are shared with this table, not copied.
+
+		"""
+		table = copy.copy(self)
+		table.selected = self.selected & mask
+		return table
+
+	def patch(self, out, rtn, added):
+		"""Return a table for updated itinerary lists out and rtn.
+
+		Rather than rebuilding the cross product, rows using
+		itineraries no longer in out or rtn are dropped and rows using
+		the added itineraries (a dict of 'OUT' and 'RTN' lists) are
+		merged in by cost.
+
+		Returns (table, keep, new, positions), where keep is a mask of
+		the rows of this table that were kept, new is a table of the
+		added rows alone and positions are where they were inserted
+		among the kept rows (as for np.insert), so that per-row masks
+		can be patched in the same way.
+
+		"""
+		out_map, rtn_map = _remap(self.out, out), _remap(self.rtn, rtn)
+		old = {'out_index' : out_map[self.out_index],
+			   'rtn_index' : rtn_map[self.rtn_index]}
+		keep = (old['out_index'] >= 0) & (old['rtn_index'] >= 0)
+		new_out, old_out = _partition(out, added['OUT'])
+		new_rtn, __ = _partition(rtn, added['RTN'])
+		everything = np.arange(len(rtn))
+		new = OptionTable(
+				out, rtn,
+				np.concatenate([np.repeat(new_out, len(rtn)),
+								np.repeat(old_out, len(new_rtn))]),
+				np.concatenate([np.tile(everything, len(new_out)),
+								np.tile(new_rtn, len(old_out))]))
+		positions = np.searchsorted(self.cost[keep], new.cost,
+									side='right')
+		table = copy.copy(self)
+		table.out, table.rtn = out, rtn
+		for name in self.columns:
+			column = old.get(name, getattr(self, name))
+			setattr(table, name, np.insert(column[keep], positions,
+										   getattr(new, name)))
+		return table, keep, new, positions
+
+
+def _remap(old, new):
+	# Index in new of each itinerary in old (-1 if it's been removed).
+	position = dict((id(itinerary), i) for i, itinerary in enumerate(new))
+	return np.array([position.get(id(itinerary), -1)
+					 for itinerary in old], dtype=int)
+
+
+def _partition(itineraries, added):
+	# Indices of the added and the other itineraries.
+	ids = set(id(itinerary) for itinerary in added)
+	flags = np.array([id(itinerary) in ids for itinerary in itineraries],
+					 dtype=bool)
+	return np.flatnonzero(flags), np.flatnonzero(~flags)
+
+
+class OptionView(object):
+	"""A lazy view of the (out, rtn) itinerary combinations.
+
+	Options are produced on demand from the outward and return
+	itinerary lists rather than held in memory, so counting or paging
+	through the first few options never builds the full cross
+	product. Options are yielded in itinerary order (not by cost).
+
+		out, rtn : lists of Itinerary instances
+		predicates : sequence of callables; an option is only part of
+					 the view if every predicate returns True for it.
+
+	"""
+	def __init__(self, out, rtn, predicates=()):
+		self.out = out
+		self.rtn = rtn
+		self.predicates = tuple(predicates)
+
+	def __iter__(self):
+		options = itertools.starmap(make_option,
+									itertools.product(self.out,
+													  self.rtn))
+		for predicate in self.predicates:
+			options = itertools.ifilter(predicate, options)
+		return options
+
+	def __len__(self):
+		if not self.predicates:
+			return len(self.out) * len(self.rtn)
+		return sum(1 for __ in self)
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			start, stop, step = index.start, index.stop, index.step
+			if step is not None and step < 0:
+				return list(self)[index]
+			if (start is not None and start < 0 or
+					stop is not None and stop < 0):
+				# negative bounds are relative to the length
+				start, stop, step = index.indices(len(self))
+			return list(itertools.islice(self, start, stop, step))
+		if index < 0:
+			index += len(self)
+		if not self.predicates and 0 <= index < len(self):
+			i, j = divmod(index, len(self.rtn))
+			return make_option(self.out[i], self.rtn[j])
+		for option in itertools.islice(self, index, None):
+			return option
+		raise IndexError('OptionView index out of range')
+
+	def filter(self, predicate):
+		"""Return a new view further restricted by a predicate."""
+		return OptionView(self.out, self.rtn,
+						  self.predicates + (predicate,))
+
+
 class Trip(object):
 	"""A <-> B, potentially aysmmetrical trip via channel ferries.
 	
 	This provides a range of potential combinations with metadata for
 	decision-making assistance purposes.
+
+	Options are held in one of three stores, selected with the `store`
+	argument:
+
+		'list' : (default) all combinations are generated up-front
+				 and sorted by cost.
+		'lazy' : options is an OptionView generating combinations on
+				 demand; nothing is materialised until iterated.
+		'columnar' : options is an OptionTable of NumPy arrays;
+					 constraints are applied as vectorised masks.
+
+	The connection argument is the minimum check-in/connection time
+	before a scheduled departure (see Route).
+
+	Origin and destination are passed to LocationMap, along with the
+	ferry network (a places.PortNetwork) and any geographic limits on
+	the ports considered (nearest, detour, with the endpoints located
+	by coordinates); for endpoints outside the UK and FR use Location
+	instances.
+
+	With prune=True, dominated sailings and car route variants are
+	dropped before any itineraries are generated (see SegmentMap).
 	
 	"""
-	def __init__(self, origin, destination, ferries, car_routes):
-		self.segmap = SegmentMap(car_routes, ferries)
-		self.lmap = LocationMap(origin, destination)
+	def __init__(self, origin, destination, ferries, car_routes,
+				 store='list', connection=timedelta(0),
+				 network=DEFAULT_NETWORK, nearest=None, detour=None,
+				 coordinates=None, prune=False):
+		if store not in ('list', 'lazy', 'columnar'):
+			raise ValueError("Unrecognised store: {}".format(store))
+		self.store = store
+		self.connection = connection
+		self.segmap = SegmentMap(car_routes, ferries, prune)
+		self.expander = PathExpander(self.segmap, connection)
+		self.lmap = LocationMap(origin, destination, network=network,
+								nearest=nearest, detour=detour,
+								coordinates=coordinates)
+		self.routes = self._routes()
 		itineraries = self._itineraries()
 		self.out = itineraries['OUT']
 		self.rtn = itineraries['RTN']
 		self.origin = self.lmap.origin
 		self.destination = self.lmap.destination
-		self.options = self._generate_options() 
-		self.options.sort(key=lambda x: x.cost)
-		self.total_options = len(self.options)
+		if store == 'list':
+			self._base = self._generate_options() 
+			self._base.sort(key=lambda x: x.cost)
+		else:
+			self._base = self._store_view()
+		self.total_options = len(self._base)
+		self.constraints = OrderedDict()
+		self._selections = {}
+		self._options = None
+		self._cost_sorted = None
+
+	@property
+	def options(self):
+		"""Options satisfying all current constraints."""
+		if self._options is None:
+			self._options = self._select()
+		return self._options
+
+	def _routes(self):
+		# Routes for all outward and return paths.
+		return dict((direction, [self._route(path)
+								 for path in self.lmap.paths[direction]])
+					for direction in ('OUT', 'RTN'))
+
+	def _route(self, path):
+		# Route sharing the trip's path expander.
+		return Route(path, self.segmap, self.connection, self.expander)
 
 	def _itineraries(self):
-		# Generate itineraries for all routes (and their variants).
+		# Collect itineraries for all routes (and their variants).
 		d = {}
-		for direction in ('OUT', 'RTN'):
-			route_list = [Route(path, self.segmap)
-						  for path in self.lmap.paths[direction]]
-			route_list = filter(None, route_list)
+		for direction, route_list in self.routes.items():
 			d[direction] = [itinerary
 							for route in route_list
 							for itinerary in route]
 		return d
 
+	def _store_view(self):
+		# Lazy or columnar store over the current itineraries.
+		if self.store == 'lazy':
+			return OptionView(self.out, self.rtn)
+		return OptionTable(self.out, self.rtn)
+
+	# ----------------------------------------------------------------
+	# Incremental updates
+	# ----------------------------------------------------------------
+	def add_ferry(self, ferry_data):
+		"""Add a ferry crossing (FerryData) to the trip."""
+		self._update(self.segmap.add_ferry(ferry_data))
+
+	def remove_ferry(self, ferry_data):
+		"""Remove a ferry crossing (FerryData) from the trip."""
+		self._update(self.segmap.remove_ferry(ferry_data))
+
+	def add_car(self, car_data):
+		"""Add a (directional) car route (CarData) to the trip."""
+		self._update(self.segmap.add_car(car_data))
+
+	def remove_car(self, car_data):
+		"""Remove a (directional) car route (CarData) from the trip."""
+		self._update(self.segmap.remove_car(car_data))
+
+	def _update(self, key):
+		# Regenerate only the routes traversing a changed location
+		# pair, then patch the options with the affected itineraries.
+		self.expander.clear()
+		removed = set()
+		added = {'OUT' : [], 'RTN' : []}
+		for direction, route_list in self.routes.items():
+			for i, route in enumerate(route_list):
+				if key not in zip(route.path, route.path[1:]):
+					continue
+				removed.update(id(itinerary) for itinerary in route)
+				route_list[i] = self._route(route.path)
+				added[direction].extend(route_list[i])
+		itineraries = self._itineraries()
+		self.out = itineraries['OUT']
+		self.rtn = itineraries['RTN']
+
+		if self.store == 'list':
+			self._patch_options(removed, added)
+		elif self.store == 'columnar':
+			self._patch_table(added)
+		else:
+			self._base = self._store_view() # nothing materialised
+		self.total_options = len(self._base)
+		self._options = None
+		self._cost_sorted = None
+
+	def _patch_options(self, removed, added):
+		# Drop options using removed itineraries and merge in those
+		# using new ones, keeping the list sorted by cost. Constraint
+		# selections are remapped, evaluating only the new options.
+		new_out = set(id(itinerary) for itinerary in added['OUT'])
+		kept = [i for i, option in enumerate(self._base)
+				if id(option.out) not in removed and
+				id(option.rtn) not in removed]
+		new = [make_option(out, rtn)
+			   for out in added['OUT']
+			   for rtn in self.rtn]
+		new += [make_option(out, rtn)
+				for out in self.out if id(out) not in new_out
+				for rtn in added['RTN']]
+		new.sort(key=lambda x: x.cost)
+		# Merge the two sorted runs (kept options first on ties).
+		base = self._base
+		runs = heapq.merge(((base[i].cost, 0, k)
+							for k, i in enumerate(kept)),
+						   ((option.cost, 1, k)
+							for k, option in enumerate(new)))
+		options, moved, placed = [], {}, [None] * len(new)
+		for __, run, k in runs:
+			if run == 0:
+				moved[kept[k]] = len(options)
+				options.append(base[kept[k]])
+			else:
+				placed[k] = len(options)
+				options.append(new[k])
+		for name, criterion in self.constraints.items():
+			excluded = [moved[i] for i in self._selections[name]
+						if i in moved]
+			excluded.extend(placed[k] for k, option in enumerate(new)
+							if not criterion(option))
+			self._selections[name] = frozenset(excluded)
+		self._base = options
+
+	def _patch_table(self, added):
+		# Patch the table and the constraint masks, evaluating the
+		# constraints only for the new rows.
+		table, keep, new, positions = self._base.patch(self.out,
+													   self.rtn, added)
+		for name, criterion in self.constraints.items():
+			self._selections[name] = np.insert(
+					self._selections[name][keep], positions,
+					criterion.mask(new))
+		self._base = table
+
 	def _generate_options(self):
 		# List of possible (out, rtn) itinerary combinations.
-		return [Option(itinerary_1, 
-					   itinerary_2, 
-					   (itinerary_1.cost + itinerary_2.cost)/4,
-					   itinerary_1[-1].datetime)
+		return [make_option(itinerary_1, itinerary_2)
 				for itinerary_1 in self.out
 				for itinerary_2 in self.rtn]
 
-	def constrain(self, criteria, values):
+	def constrain(self, criteria, values=None, name=None):
 		"""Constrain the trip based on specified criteria.
 
-		Criteria is a recognised string, values is a sequence of
-		criteria-dependent types. Most criteria only look at the first
-		element.
+		Criteria is either a recognised string, with values a sequence
+		of criteria-dependent types, or a `criteria.Criterion`
+		instance (or a sequence of them) with no values. Most string
+		criteria only look at the first element of values.
+
+		Supported string criteria are
 
-		Supported criteria are
+		  - 'arrival' : Destination arrival datetime. Values are
+			multiple datetimes for different arrival dates.
+		  - 'destdep' : Destination departure datetime.
+		  - 'return' : Origin arrival datetime.
+		  - 'drive' : Post-ferry outward driving duration.
+		  - 'cost' : Cost
 
-		  - Destination arrival datetime. Values are multiple
-			datetimes for different arrival dates.
-		  - Destination departure datetime.
-		  - Origin arrival datetime.
-		  - Post-ferry outward driving duration.
-		  - Cost
+		Several criteria passed together are applied in a single pass
+		over the options.
 
-		Adding criteria truncates the available options. Relaxing
-		criteria requires a new Trip instance.
+		Constraints are named (by default, the criteria string or the
+		criterion's name) and don't modify the underlying options.
+		Constraining with an existing name replaces that constraint,
+		so criteria can be tightened or relaxed; see also `relax`.
+		Only the new criterion is evaluated; with a lazy store it is
+		only evaluated as the options are iterated.
 
 		"""
-		# This is a bit of a bespoke, inflexible implementation based
-		# on current need.
-		exclude = []
-		if criteria == 'arrival':
-			datetimes = [dt + timedelta(minutes=90) for dt in values]
-			dates = [dt.date() for dt in values]
-			for option in self.options:
-				b = [option.arrival_time.date() == d for d in dates]
-				date_constrained = any(b)
-				if date_constrained:
-					dt = list(itertools.compress(datetimes, b))[0]
-					if option.arrival_time > dt:
-						exclude.append(option)
-
-		elif criteria == 'drive':
-			buf = timedelta(minutes=30) 
-			for option in self.options:
-				if option.out[-2].duration > (values[0] + buf):
-					exclude.append(option)
-
-		elif criteria == 'destdep':
-			buf = timedelta(minutes=60)
-			for option in self.options:
-				if option.rtn[0].datetime < (values[0] - buf):
-					exclude.append(option)
-
-		elif criteria == 'return':
-			buf = timedelta(minutes=60)
-			for option in self.options:
-				if option.rtn[-1].datetime > (values[0] + buf):
-					exclude.append(option)
-
-		elif criteria == 'cost':
-			buf = 10.0
-			for option in self.options:
-				if option.cost > values[0] + buf:
-					exclude.append(option)
-		
-		self.options = filter(lambda o: o not in exclude, 
-							  self.options)
+		if isinstance(criteria, basestring):
+			criterion = from_name(criteria, values)
+			name = name or criteria
+		else:
+			criterion = compile_criteria(criteria)
+			name = name or criterion.name
+		self.constraints[name] = criterion
+		self._selections[name] = self._evaluate(criterion)
+		self._options = None
+
+	def relax(self, name=None):
+		"""Remove a named constraint (or all constraints)."""
+		if name is None:
+			self.constraints.clear()
+			self._selections.clear()
+		else:
+			del self.constraints[name]
+			del self._selections[name]
+		self._options = None
+
+	def _evaluate(self, criterion):
+		# Selection of the base options for a single criterion: a
+		# boolean mask for a table, a set of excluded indices for a
+		# list. Lazy views evaluate criteria on iteration instead.
+		base = self._base
+		if isinstance(base, OptionTable):
+			return criterion.mask(base)
+		elif isinstance(base, OptionView):
+			return None
+		return frozenset(i for i, option in enumerate(base)
+						 if not criterion(option))
+
+	def _select(self):
+		# Combine the cached selections into a view of the base.
+		base = self._base
+		if isinstance(base, OptionView):
+			return OptionView(self.out, self.rtn,
+							  self.constraints.values())
+		elif isinstance(base, OptionTable):
+			mask = np.ones(len(base.cost), dtype=bool)
+			for selection in self._selections.values():
+				mask &= selection
+			return base.where(mask)
+		elif not self._selections:
+			return base
+		excluded = frozenset().union(*self._selections.values())
+		return [option for i, option in enumerate(base)
+				if i not in excluded]
+
+	def top_k(self, k, key='cost'):
+		"""Return the k best options, without a full cross product.
+
+		The outward and return itineraries are sorted by cost once and
+		the cheapest pair sums are then merged with a heap, so only
+		around k combinations are ever generated. Options excluded by
+		earlier constraints are skipped.
+
+		Only 'cost' is supported as a key (other criteria don't
+		decompose into an outward and return part).
+
+		"""
+		if key != 'cost':
+			raise ValueError("Unsupported key: {}".format(key))
+		return list(itertools.islice(self._cheapest(), k))
+
+	def _cheapest(self):
+		# Generate options in ascending cost order (k-best pair sums).
+		if self._cost_sorted is None:
+			cost = lambda itinerary: itinerary.cost
+			self._cost_sorted = (sorted(self.out, key=cost),
+								 sorted(self.rtn, key=cost))
+		out, rtn = self._cost_sorted
+		if not (out and rtn):
+			return
+		heap = [(out[0].cost + rtn[0].cost, 0, 0)]
+		seen = set([(0, 0)])
+		while heap:
+			__, i, j = heapq.heappop(heap)
+			option = make_option(out[i], rtn[j])
+			if all(keep(option) for keep in self.constraints.values()):
+				yield option
+			for i_, j_ in ((i + 1, j), (i, j + 1)):
+				if (i_ < len(out) and j_ < len(rtn) and
+						(i_, j_) not in seen):
+					seen.add((i_, j_))
+					heapq.heappush(heap,
+								   (out[i_].cost + rtn[j_].cost, i_, j_))
+
+	# Option attributes available as Pareto criteria (all minimised).
+	objectives = {
+			'cost'    : lambda option: option.cost,
+			'arrival' : lambda option: option.arrival_time,
+			'drive'   : lambda option: option.out[-2].duration,
+			'return'  : lambda option: option.rtn[-1].datetime
+			}
+
+	def pareto(self, criteria=('cost', 'arrival', 'drive')):
+		"""Return the Pareto frontier of the (constrained) options.
+
+		Options on the frontier are not dominated by any other option
+		in the given criteria (see `objectives`): no other option is
+		as good in every criterion and better in at least one. The
+		default criteria are cost, destination arrival time and
+		post-ferry drive duration.
+
+		"""
+		try:
+			keys = [self.objectives[c] for c in criteria]
+		except KeyError as e:
+			raise ValueError("Unsupported criteria: {}".format(e))
+		key = lambda option: tuple(f(option) for f in keys)
+		return frontier(self.options, key)
 
 	def noptions(self):
 		"""Return the number of options."""